@@ -0,0 +1,125 @@
+"""
+Micro-benchmark of parsing Directions API responses, comparing the single-pass parser in
+tools/directions_parser.py with the previous parser, which decoded the whole body again for
+every field it read and built a BeautifulSoup tree for every step.
+
+Run from the repository root with: python -m benchmarks.bench_directions_parser
+"""
+import json
+import random
+import timeit
+
+from tools.directions_parser import parse_directions, render_routes
+
+try:
+    from bs4 import BeautifulSoup
+
+    def get_text(step):
+        return BeautifulSoup(step, "html.parser").get_text().strip()
+
+except ImportError:
+    from html.parser import HTMLParser
+
+    # stand-in with the same behaviour as BeautifulSoup's get_text, when bs4 is missing
+    class TextExtractor(HTMLParser):
+        def __init__(self):
+            super().__init__()
+            self.parts = []
+
+        def handle_data(self, data):
+            self.parts.append(data)
+
+    def get_text(step):
+        parser = TextExtractor()
+        parser.feed(step)
+        return "".join(parser.parts).strip()
+
+
+ROADS = ["PIE", "AYE", "CTE", "Boon Lay Way", "Jurong West Ave 1", "Orchard Rd", "Lornie Rd"]
+
+
+class FakeResponse:
+    def __init__(self, body):
+        self.body = body
+
+    def json(self):
+        return json.loads(self.body)
+
+
+def make_response(routes=6, steps=80, seed=0):
+    rng = random.Random(seed)
+
+    def step():
+        road = rng.choice(ROADS)
+        return {
+            "html_instructions": f"Turn <b>{rng.choice(['left', 'right'])}</b> onto <b>{road}</b>"
+            '<div style="font-size:0.9em">Toll road &amp; restricted usage</div>',
+            "distance": {"text": "1.2 km", "value": rng.randint(10, 5000)},
+            "duration": {"text": "3 mins", "value": rng.randint(10, 600)},
+            "travel_mode": "DRIVING",
+            "polyline": {"points": "".join(rng.choice("abcdefghij?@_~") for _ in range(40))},
+        }
+
+    return {
+        "status": "OK",
+        "routes": [
+            {
+                "summary": rng.choice(ROADS),
+                "legs": [
+                    {
+                        "distance": {"text": "20.1 km", "value": 20100},
+                        "duration": {"text": "25 mins", "value": 1500},
+                        "steps": [step() for _ in range(steps)],
+                    }
+                ],
+            }
+            for _ in range(routes)
+        ],
+    }
+
+
+def previous_parse_response(response):
+    clean_steps = []
+    total_distance = []
+    total_duration = []
+
+    options = len(response.json()["routes"])
+    output_str = ""
+    if options > 0:
+        output_str += f"There are {options} options to go there:\n"
+        for k in range(0, options):
+            steps = []
+            for i in range(0, len(response.json()["routes"][k]["legs"][0]["steps"])):
+                steps.append(response.json()["routes"][k]["legs"][0]["steps"][i]["html_instructions"])
+            clean_steps.append([get_text(step) for step in steps])
+            total_distance.append(response.json()["routes"][k]["legs"][0]["distance"]["text"])
+            total_duration.append(response.json()["routes"][k]["legs"][0]["duration"]["text"])
+        for k in range(0, options):
+            output_str += f"Option {k+1} takes {total_duration[k]} and is {total_distance[k]} long!\n"
+            for line in clean_steps[k]:
+                output_str += line + "\n"
+            output_str += "\n\n"
+    else:
+        return "Exact address not found, please try again."
+    return output_str
+
+
+def single_pass_parse_response(body):
+    return render_routes(parse_directions(json.loads(body)))
+
+
+def main():
+    for routes, steps in [(1, 10), (3, 40), (6, 80)]:
+        body = json.dumps(make_response(routes, steps))
+        previous = timeit.repeat(lambda: previous_parse_response(FakeResponse(body)), number=3, repeat=5)
+        single_pass = timeit.repeat(lambda: single_pass_parse_response(body), number=3, repeat=5)
+        previous_ms, single_pass_ms = min(previous) / 3 * 1000, min(single_pass) / 3 * 1000
+        print(
+            f"{routes} routes x {steps} steps ({len(body) / 1024:.0f} KiB): "
+            f"previous {previous_ms:.2f} ms, single pass {single_pass_ms:.2f} ms, "
+            f"{previous_ms / single_pass_ms:.0f}x faster"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+Benchmark of snapping routes onto road links with data/MapMatcher.py, over a synthetic road
+network the size of Singapore's: a grid of two-way roads with one link per block and
+carriageway, with jittered junctions. Routes are random walks over the grid, given as
+polylines with a point every few metres and a few metres of noise, like Directions API routes.
+
+Reports how long building and refreshing the index takes, how long matching a route takes
+by its number of points, how many routes a second a single core matches when many threads
+share it, and how many of the links each route really runs on are found, in order.
+
+Run from the repository root with: python -m benchmarks.bench_map_matching
+"""
+import datetime
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from data.MapMatcher import MapMatcher
+from data.SnapshotCache import Snapshot
+from utils.geo import decode_polyline, encode_polyline
+
+METRES_PER_DEGREE = 111320
+ORIGIN = (1.25, 103.62)  # south west corner of the network
+
+
+def make_network(columns=200, rows=100, block_m=250, jitter_m=15, seed=0):
+    """
+    :returns: tuple of (dataframe of links like the trafficspeedbands table, array of the
+        (lat, lon) of every junction)
+    """
+    rng = np.random.default_rng(seed)
+    lon_scale = METRES_PER_DEGREE * np.cos(np.radians(ORIGIN[0]))
+    shape = (rows + 1, columns + 1)
+    x = np.arange(columns + 1)[None, :] * block_m + rng.uniform(-jitter_m, jitter_m, shape)
+    y = np.arange(rows + 1)[:, None] * block_m + rng.uniform(-jitter_m, jitter_m, shape)
+    junctions = np.stack([ORIGIN[0] + y / METRES_PER_DEGREE, ORIGIN[1] + x / lon_scale], axis=-1)
+
+    links = []
+    for (di, dj), street in (((0, 1), "STREET"), ((1, 0), "AVENUE")):
+        i, j = np.meshgrid(np.arange(rows + 1 - di), np.arange(columns + 1 - dj), indexing="ij")
+        i, j = i.ravel(), j.ravel()
+        start, end = junctions[i, j], junctions[i + di, j + dj]
+        names = [f"{street} {n}" for n in (i if dj else j)]
+        # one link per carriageway, each going its own way
+        for direction, (a, b) in (("F", (start, end)), ("R", (end, start))):
+            links.append(
+                pd.DataFrame(
+                    {
+                        "linkid": [f"{street[0]}{p}-{q}{direction}" for p, q in zip(i, j)],
+                        "roadname": names,
+                        "startlat": a[:, 0],
+                        "startlon": a[:, 1],
+                        "endlat": b[:, 0],
+                        "endlon": b[:, 1],
+                    }
+                )
+            )
+    return pd.concat(links, ignore_index=True), junctions
+
+
+def make_route(junctions, blocks, spacing_m=10, noise_m=3, seed=0):
+    """
+    Random walk over the grid which never turns back on itself.
+
+    :returns: tuple of (encoded polyline, list of the ids of the links it runs on)
+    """
+    rng = np.random.default_rng(seed)
+    rows, columns = junctions.shape[0] - 1, junctions.shape[1] - 1
+    i, j = rng.integers(rows), rng.integers(columns)
+    path, link_ids, previous = [(i, j)], [], None
+    while len(link_ids) < blocks:
+        di, dj = [(0, 1), (1, 0), (0, -1), (-1, 0)][rng.integers(4)]
+        ni, nj = i + di, j + dj
+        if not (0 <= ni <= rows and 0 <= nj <= columns) or (ni, nj) == previous:
+            continue
+        if di == 0:
+            link_ids.append(f"S{i}-{min(j, nj)}{'F' if dj > 0 else 'R'}")
+        else:
+            link_ids.append(f"A{min(i, ni)}-{j}{'F' if di > 0 else 'R'}")
+        previous, (i, j) = (i, j), (ni, nj)
+        path.append((i, j))
+
+    corners = junctions[tuple(np.array(path).T)]
+    lon_scale = METRES_PER_DEGREE * np.cos(np.radians(ORIGIN[0]))
+    lats, lons = [], []
+    for (lat0, lon0), (lat1, lon1) in zip(corners[:-1], corners[1:]):
+        block_m = np.hypot((lat1 - lat0) * METRES_PER_DEGREE, (lon1 - lon0) * lon_scale)
+        t = np.linspace(0, 1, max(int(block_m / spacing_m), 1), endpoint=False)
+        lats.append(lat0 + t * (lat1 - lat0))
+        lons.append(lon0 + t * (lon1 - lon0))
+    lats = np.concatenate(lats + [corners[-1:, 0]])
+    lons = np.concatenate(lons + [corners[-1:, 1]])
+    lats = lats + rng.normal(0, noise_m, len(lats)) / METRES_PER_DEGREE
+    lons = lons + rng.normal(0, noise_m, len(lons)) / lon_scale
+    return encode_polyline(lats, lons), link_ids
+
+
+def ordered_recall(found, expected):
+    """
+    :returns: fraction of the expected links found in the same order, i.e. the length of the
+        longest common subsequence over the number of expected links
+    """
+    previous = [0] * (len(found) + 1)
+    for link_id in expected:
+        current = [0]
+        for k, other in enumerate(found):
+            if link_id == other:
+                current.append(previous[k] + 1)
+            else:
+                current.append(max(previous[k + 1], current[k]))
+        previous = current
+    return previous[-1] / len(expected)
+
+
+def main():
+    links, junctions = make_network()
+    now = datetime.datetime.now()
+    matcher = MapMatcher()
+    start = time.perf_counter()
+    matcher.on_snapshot(Snapshot("trafficspeedbands", 1, links, now))
+    print(f"{len(links)} links: built in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    # a refresh which moves 1% of the links and drops another 1%
+    moved = links.sample(frac=0.02, random_state=0).index
+    refreshed = links.copy()
+    refreshed.loc[moved[: len(moved) // 2], ["startlat", "endlat"]] += 5 / METRES_PER_DEGREE
+    refreshed = refreshed.drop(moved[len(moved) // 2 :])
+    start = time.perf_counter()
+    matcher.on_snapshot(Snapshot("trafficspeedbands", 2, refreshed, now))
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    print(f"refresh moving and removing {len(moved)} links: {elapsed_ms:.0f} ms")
+    matcher.on_snapshot(Snapshot("trafficspeedbands", 3, links, now))
+
+    for blocks in (10, 40, 160):
+        routes = [make_route(junctions, blocks, seed=seed) for seed in range(20)]
+        points = np.mean([len(decode_polyline(polyline)[0]) for polyline, _ in routes])
+        start = time.perf_counter()
+        matched = [matcher.match([polyline]) for polyline, _ in routes]
+        elapsed_ms = (time.perf_counter() - start) / len(routes) * 1000
+        recall = np.mean(
+            [
+                ordered_recall(route.link_ids, link_ids)
+                for route, (_, link_ids) in zip(matched, routes)
+            ]
+        )
+        print(
+            f"{blocks * 250 / 1000:.1f} km routes (~{points:.0f} points): {elapsed_ms:.2f} ms each, "
+            f"{recall:.1%} of links found in order"
+        )
+
+    routes = [make_route(junctions, 80, seed=seed)[0] for seed in range(200)]
+    for threads in (1, 8, 32):
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            start = time.perf_counter()
+            list(pool.map(lambda polyline: matcher.match([polyline]), routes))
+            elapsed = time.perf_counter() - start
+        print(f"{threads} threads: {len(routes) / elapsed:.0f} routes of 20 km a second")
+
+
+if __name__ == "__main__":
+    main()
@@ -12,11 +12,14 @@ from telegram.ext import (
     filters,
 )
 
+from data_manager import data_manager
 from langchain_interface import LangchainInterface
+from scheduler import IngestionScheduler
 from custom_logger import logger
 
 
 LC_INTERFACE = LangchainInterface()
+SCHEDULER = IngestionScheduler()
 
 
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -61,7 +64,7 @@ async def normal_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     placeholder_msg = await update.message.reply_text("Thinking...")
     user_message = update.message.text
     chat_history = context.user_data["history"]
-    answer, new_history = LC_INTERFACE.query_agent(user_message, chat_history)
+    answer, new_history = await LC_INTERFACE.aquery_agent(user_message, chat_history)
     logger.info(f"User {user_id} queries: {user_message}")
 
     # Update history
@@ -80,11 +83,28 @@ def escape_markdown(text):
     return re.sub(f"([{re.escape(escape_chars)}])", r"\\\1", text)
 
 
+async def start_scheduler(application: Application) -> None:
+    """Keeps the database fresh in the background while the bot is running."""
+    SCHEDULER.start()
+
+
+async def stop_scheduler(application: Application) -> None:
+    await SCHEDULER.stop()
+    # the async connection pool belongs to this event loop, so close it before the loop stops
+    await data_manager().async_database.dispose()
+
+
 def main() -> None:
     dotenv.load_dotenv()
     TELEGRAM_TOKEN = os.environ.get("TELEGRAM_API_KEY")
 
-    application = Application.builder().token(TELEGRAM_TOKEN).build()
+    application = (
+        Application.builder()
+        .token(TELEGRAM_TOKEN)
+        .post_init(start_scheduler)
+        .post_shutdown(stop_scheduler)
+        .build()
+    )
 
     application.add_handler(CommandHandler("start", start_command))
     application.add_handler(CommandHandler("stop", stop_command))
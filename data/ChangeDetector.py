@@ -0,0 +1,89 @@
+import numpy as np
+import pandas as pd
+
+# columns which are set by us on every call, and so say nothing about whether the data changed
+IGNORED_COLUMNS = ["timestamp"]
+
+
+def to_tuple(value):
+    return tuple(value) if isinstance(value, list) else value
+
+
+class ChangeDetector:
+    """
+    Remembers fingerprints of the data last written to each table, so that refreshes
+    which return the same data as before do not have to be written to the database again.
+
+    There are two levels of fingerprints. The payload hash is a hash of the raw response
+    body computed by the API interfaces, which lets us skip a refresh entirely if nothing
+    changed. Otherwise, each row is hashed so that only new or changed rows are written
+    for tables with a natural key. Tables without a natural key can only be compared as
+    a whole, so they are either skipped or written fully.
+
+    Fingerprints are only kept in memory, so the first refresh after a restart always
+    writes everything, and has to delete every row not in the feed itself, since there is
+    nothing to tell which rows disappeared. They should only be committed after the write
+    succeeded.
+    """
+
+    def __init__(self):
+        self.payload_hashes = {}
+        self.row_hashes = {}
+
+    def has_fingerprints(self, table_name):
+        return table_name in self.row_hashes
+
+    def payload_unchanged(self, table_name, payload_hash):
+        return self.payload_hashes.get(table_name) == payload_hash
+
+    def diff(self, table_name, df, keys=None):
+        """
+        Compares the rows of a newly fetched table against those last committed.
+
+        :param table_name: the name of the table the data is for
+        :param df: dataframe of newly fetched data
+        :param keys: list of natural key columns of the table, if any
+        :returns: tuple of (rows to write, keys of rows to delete, row fingerprints),
+            where the rows to write are empty if nothing changed and the keys to delete
+            are None if there are none, or if there are no fingerprints to compare against
+        """
+        if keys is None:
+            hashes = np.sort(self.hash_rows(df).to_numpy())
+            old_hashes = self.row_hashes.get(table_name)
+            if old_hashes is not None and np.array_equal(hashes, old_hashes):
+                return df.iloc[:0], None, hashes
+            return df, None, hashes
+
+        # an empty feed has no columns but the timestamp, and means every key was removed
+        missing = [key for key in keys if key not in df.columns]
+        if missing:
+            df = df.assign(**{key: pd.Series(index=df.index, dtype=object) for key in missing})
+        # the database can only hold one row per key anyway
+        df = df.drop_duplicates(subset=keys, keep="last")
+        hashes = self.hash_rows(df)
+        hashes.index = df.set_index(keys).index
+        old_hashes = self.row_hashes.get(table_name)
+        if old_hashes is None:
+            return df, None, hashes
+
+        # new rows get a hash of 0 from the old fingerprints, and so count as changed
+        changed = (hashes != old_hashes.reindex(hashes.index, fill_value=0)).to_numpy()
+        removed = old_hashes.index.difference(hashes.index)
+        removed_keys = removed.to_frame(index=False) if len(removed) > 0 else None
+        return df[changed], removed_keys, hashes
+
+    def commit(self, table_name, payload_hash, row_hashes):
+        self.payload_hashes[table_name] = payload_hash
+        self.row_hashes[table_name] = row_hashes
+
+    def hash_rows(self, df):
+        df = df.drop(columns=IGNORED_COLUMNS, errors="ignore")
+        # lists, e.g. the roads of incidents, are not hashable but tuples are
+        list_columns = [
+            col
+            for col in df.columns
+            if df[col].dtype == object and df[col].map(lambda value: isinstance(value, list)).any()
+        ]
+        if list_columns:
+            df = df.assign(**{col: df[col].map(to_tuple) for col in list_columns})
+        return pd.util.hash_pandas_object(df, index=False)
@@ -1,10 +1,61 @@
 import os
+import re
 import requests
 import json
 import datetime
+import hashlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 import pandas as pd
 
+from data.json_stream import ColumnBuffer, iter_array_items
+from http_client import http_client
+from utils.geo import geohash_encode
+from utils.road_names import extract_incident_roads
+
+# Datamall never returns more than this many records per request, the rest have
+# to be fetched page by page with the $skip parameter
+PAGE_SIZE = 500
+# hard stop so a misbehaving endpoint can never make us page forever
+MAX_PAGES = 200
+# size of the chunks read off streamed responses
+STREAM_CHUNK_SIZE = 64 * 1024
+# precision of the geohashes of carparks, at which a cell is about 1.2km by 0.6km
+CARPARK_GEOHASH_PRECISION = 6
+# incident messages start with the time they were reported, e.g. "(17/10)14:32 Accident on PIE"
+INCIDENT_TIME_PREFIX = re.compile(r"^\((\d{1,2})/(\d{1,2})\)(\d{1,2}):(\d{2})\s*")
+
+
+def close_response(future):
+    if future.exception() is None:
+        future.result().close()
+
+
+def parse_reported_at(messages, now=None):
+    """
+    Parses the "(dd/mm)HH:MM" prefix of incident messages into timestamps. The prefix has no
+    year, so the current year is assumed, unless that puts the time in the future, in which
+    case the incident was reported last year, e.g. on 31/12 for a message read on 01/01.
+
+    :param messages: series of incident messages
+    :param now: time the messages were fetched, defaults to now
+    :returns: tuple of (series of timestamps, series of messages without the prefix).
+        Messages without a prefix are kept as they are, with a missing timestamp.
+    """
+    now = pd.Timestamp(now or datetime.datetime.now())
+    parts = messages.str.extract(INCIDENT_TIME_PREFIX).astype("float64")
+    parts.columns = ["day", "month", "hour", "minute"]
+
+    def to_timestamps(year):
+        return pd.to_datetime(parts.assign(year=year), errors="coerce")
+
+    reported_at = to_timestamps(now.year)
+    # allow for clock skew between us and Datamall before deciding a time is in the future
+    in_future = reported_at > now + pd.Timedelta(hours=1)
+    reported_at = reported_at.mask(in_future, to_timestamps(now.year - 1))
+    return reported_at, messages.str.replace(INCIDENT_TIME_PREFIX, "", n=1, regex=True)
+
 
 class DatamallInterface:
     """
@@ -13,7 +64,8 @@ class DatamallInterface:
     API. To add new Datamall APIs, change the code in this interface.
     """
 
-    def __init__(self, api_key):
+    def __init__(self, api_key, max_workers=4):
+        self.max_workers = max_workers
         self.headers = {"AccountKey": api_key}
         self.base_url = "http://datamall2.mytransport.sg/ltaodataservice/"
         self.api_urls = {
@@ -28,31 +80,171 @@ class DatamallInterface:
             "trafficimages": "Traffic-Imagesv2",
             "vms": "VMS",
         }  # the keys here are the corresponding table names in the database
+        self.payload_hashes = {}  # hash of the raw response of the last call of each API
+        self.unpackers = {
+            "carpark": self.unpack_carpark,
+            "trafficincidents": self.unpack_incidents,
+        }  # extra processing needed by some APIs to match their table
 
-    def call(self, api_name):
+    def call(self, api_name, stream=True):
         """
         Saves data from a Datamall API call to a Pandas DataFrame and returns it.
+        All pages of the API are fetched, see walk_pages.
+
+        In streaming mode, records are decoded straight off the response stream into column
+        buffers, so the response text and the decoded records are never held in memory
+        all at once, and the dataframe is only built at the end. Otherwise, the pages are
+        decoded whole and concatenated, see iter_pages.
 
         :param api_name: the name of the API to be called
-        :param output_file: the name of the CSV file to save the data to
+        :param stream: whether to decode the responses as they are streamed in
         :returns: dataframe of API response data
         :raises HTTPError: if API call fails
         """
+        if not stream:
+            return pd.concat(list(self.iter_pages(api_name)), ignore_index=True)
+
+        timestamp = datetime.datetime.now()
+        hasher = hashlib.blake2b(digest_size=16)
+        columns = ColumnBuffer()
+
+        def decode(response):
+            records = iter_array_items(self.iter_body(response, hasher), "value")
+            return None, columns.extend(records)
+
+        for _ in self.walk_pages(api_name, decode):
+            pass
+        self.payload_hashes[api_name] = hasher.hexdigest()
+        return self.to_frame(columns.to_frame(), timestamp, api_name)
+
+    def iter_pages(self, api_name):
+        """
+        Fetches every page of a Datamall API and yields each page as a DataFrame chunk,
+        in order. Once every page is fetched, a hash of the raw responses is saved in
+        payload_hashes.
+
+        :param api_name: the name of the API to be called
+        :returns: generator of dataframes, one per page
+        :raises HTTPError: if any API call fails
+        """
+        # every chunk of a single call shares the same timestamp
+        timestamp = datetime.datetime.now()
+        hasher = hashlib.blake2b(digest_size=16)
+
+        def decode(response):
+            records = json.loads(b"".join(self.iter_body(response, hasher)))["value"]
+            data = self.to_frame(pd.DataFrame.from_records(records), timestamp, api_name)
+            return data, len(records)
+
+        for page, data in enumerate(self.walk_pages(api_name, decode)):
+            # the first page is always yielded so that callers get the columns
+            if page == 0 or len(data) > 0:
+                yield data
+        self.payload_hashes[api_name] = hasher.hexdigest()
+
+    def walk_pages(self, api_name, decode):
+        """
+        Fetches every page of a Datamall API, decodes them in order and yields the results.
+        The first page is fetched alone so that small APIs only cost a single request. If it
+        is full, the following pages are fetched concurrently by a pool of max_workers threads,
+        keeping at most max_workers requests in flight. Paging stops at the first page with
+        less than PAGE_SIZE records.
+
+        :param api_name: the name of the API to be called
+        :param decode: function taking the response of a page and returning a tuple of
+            (result, number of records in the page), called in page order
+        :returns: generator of the results of decode
+        :raises HTTPError: if any API call fails
+        """
         api_url = self.base_url + self.api_urls[api_name]
-        response = requests.get(api_url, headers=self.headers)
+
+        result, count = decode(self.fetch_page(api_url, 0))
+        yield result
+        if count < PAGE_SIZE:
+            return
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            next_page = 1
+            pending = deque()
+            while next_page < MAX_PAGES and len(pending) < self.max_workers:
+                pending.append(pool.submit(self.fetch_page, api_url, next_page * PAGE_SIZE))
+                next_page += 1
+
+            try:
+                while pending:
+                    result, count = decode(pending.popleft().result())
+                    yield result
+                    if count < PAGE_SIZE:
+                        # we have reached the end, pages past it are dropped below
+                        break
+                    if next_page < MAX_PAGES:
+                        pending.append(
+                            pool.submit(self.fetch_page, api_url, next_page * PAGE_SIZE)
+                        )
+                        next_page += 1
+            finally:
+                # also reached if a page fails or the caller stops early, so that the
+                # streamed responses of pages fetched ahead are never left open
+                for future in pending:
+                    if not future.cancel():
+                        future.add_done_callback(close_response)
+
+    def fetch_page(self, api_url, skip):
+        """
+        Requests a single page of records from a Datamall API. The body is left unread, so
+        that it can be decoded as it is streamed in.
+
+        :param api_url: the full URL of the API
+        :param skip: number of records to skip, should be a multiple of PAGE_SIZE
+        :returns: response of this page
+        :raises HTTPError: if API call fails
+        """
+        # $skip is appended by hand, requests would percent-encode the $ sign
+        response = http_client().get(
+            f"{api_url}?$skip={skip}", headers=self.headers, stream=True
+        )
 
         # check success of API call to avoid bad data
         if response.status_code != 200:
+            response.close()
             raise requests.exceptions.HTTPError("Did not get status 200 from response")
 
-        # our tables are in the same schema as the response data
-        # directly convert to a dataframe using pd.DataFrame.from_records
-        res_val = json.loads(response.text)["value"]
-        data = pd.DataFrame.from_records(res_val)
+        return response
 
+    def iter_body(self, response, hasher):
+        with response:
+            for chunk in response.iter_content(chunk_size=STREAM_CHUNK_SIZE):
+                hasher.update(chunk)
+                yield chunk
+
+    def to_frame(self, data, timestamp, api_name):
         # make columns lowercase to match schema in our database
         data.columns = [col.lower() for col in data.columns]
-        data["timestamp"] = datetime.datetime.now()
+        data["timestamp"] = timestamp
+        if api_name in self.unpackers and len(data) > 0:
+            data = self.unpackers[api_name](data)
+        return data
+
+    def unpack_carpark(self, data):
+        # location is given as a "lat lon" string, which is split once here instead of by every reader
+        coords = data["location"].str.split(" ", n=1, expand=True).reindex(columns=[0, 1])
+        data["latitude"] = pd.to_numeric(coords[0], errors="coerce")
+        data["longitude"] = pd.to_numeric(coords[1], errors="coerce")
+        data["geohash"] = [
+            geohash_encode(lat, lon, CARPARK_GEOHASH_PRECISION)
+            if pd.notna(lat) and pd.notna(lon)
+            else None
+            for lat, lon in zip(data["latitude"], data["longitude"])
+        ]
+        return data
+
+    def unpack_incidents(self, data):
+        # the reported time and roads are parsed once here so that incidents can be
+        # filtered by time and looked up by road without parsing messages again
+        data["reported_at"], data["message"] = parse_reported_at(
+            data["message"], data["timestamp"].iloc[0]
+        )
+        data["roads"] = [extract_incident_roads(message) for message in data["message"]]
         return data
 
     def download_local(self, api_name, output_file):
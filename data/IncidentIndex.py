@@ -0,0 +1,52 @@
+import threading
+from collections import defaultdict
+
+import numpy as np
+
+from utils.road_names import normalize_road_name
+
+
+class IncidentIndex:
+    """
+    Inverted index from road name to the traffic incidents on that road, built from the roads
+    extracted from each incident message at ingest. It subscribes to the snapshot cache and is
+    rebuilt whenever a new version of the incidents table is published, so looking up incidents
+    only costs one dictionary lookup per requested road.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.incidents = None
+        self.positions = {}
+        self.snapshot = None
+
+    def on_snapshot(self, snapshot):
+        if self.snapshot is not None and self.snapshot.version == snapshot.version:
+            # same data, only refreshed_at moved
+            self.snapshot = snapshot
+            return
+
+        incidents = snapshot.data.reset_index(drop=True)
+        positions = defaultdict(list)
+        if "roads" in incidents.columns:
+            for position, roads in enumerate(incidents["roads"]):
+                # roads may be None or a numpy array when loaded back from the database
+                for road in roads if roads is not None else []:
+                    positions[road].append(position)
+        with self.lock:
+            self.incidents, self.positions, self.snapshot = incidents, dict(positions), snapshot
+
+    def is_fresh(self):
+        return self.snapshot is not None and self.snapshot.is_fresh()
+
+    def on_roads(self, roads):
+        """
+        :param roads: list of road names, in any form accepted by normalize_road_name
+        :returns: dataframe of the incidents on any of the roads, in table order
+        """
+        with self.lock:
+            incidents, positions = self.incidents, self.positions
+        matches = set()
+        for road in roads:
+            matches.update(positions.get(normalize_road_name(road), []))
+        return incidents.iloc[np.sort(np.fromiter(matches, dtype=np.int64))]
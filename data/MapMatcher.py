@@ -0,0 +1,173 @@
+import dataclasses
+import threading
+
+import numpy as np
+import pandas as pd
+
+from data.SpatialIndex import SegmentGridIndex
+from utils.geo import decode_polyline
+
+GEOMETRY_COLUMNS = ["startlat", "startlon", "endlat", "endlon"]
+# distance between the points a route is sampled at for matching
+SAMPLE_SPACING_M = 20
+
+
+@dataclasses.dataclass(slots=True)
+class MatchedRoute:
+    link_ids: list[str]  # ids of the links the route runs on, in order
+    road_names: list[str]  # names of the roads of those links, in order, without repeats in a row
+    rows: np.ndarray  # rows of the links in the matcher, for looking up other values per link
+    lengths_m: np.ndarray  # metres of the route on each link
+    length_m: float  # length of the whole route
+
+    @property
+    def matched_fraction(self):
+        return float(self.lengths_m.sum() / self.length_m) if self.length_m > 0 else 0.0
+
+
+def sample_polyline(lats, lons, project, spacing_m=SAMPLE_SPACING_M):
+    """
+    Samples points about every spacing_m metres along a polyline, at the middle of equal
+    pieces of each of its segments, so that long straight segments are matched along their
+    whole length and not only at their ends.
+
+    :param project: function projecting (lats, lons) to flat (x, y) in metres
+    :returns: tuple of (latitudes, longitudes, (dx, dy) heading of each sample, length in
+        metres each sample stands for)
+    """
+    x, y = project(lats, lons)
+    dx, dy = np.diff(x), np.diff(y)
+    lengths = np.hypot(dx, dy)
+    pieces = np.ceil(lengths / spacing_m).astype(np.int64)  # 0 for repeated points
+    segments = np.repeat(np.arange(len(lengths)), pieces)
+    starts = np.repeat(np.cumsum(pieces) - pieces, pieces)
+    t = (np.arange(len(segments)) - starts + 0.5) / pieces[segments]
+    lats, lons = np.asarray(lats, dtype=np.float64), np.asarray(lons, dtype=np.float64)
+    return (
+        lats[segments] + t * np.diff(lats)[segments],
+        lons[segments] + t * np.diff(lons)[segments],
+        np.stack([dx[segments], dy[segments]], axis=1),
+        (lengths / np.maximum(pieces, 1))[segments],
+    )
+
+
+def collapse_runs(values, lengths):
+    """
+    :returns: tuple of (values, total lengths) of each run of equal values in a row
+    """
+    if len(values) == 0:
+        return values, lengths
+    starts = np.flatnonzero(np.concatenate([[True], values[1:] != values[:-1]]))
+    return values[starts], np.add.reduceat(lengths, starts)
+
+
+class MapMatcher:
+    """
+    Snaps routes onto the road links of the trafficspeedbands table, to tell which LTA links
+    and roads a Google route actually runs on. The route is sampled along its length and each
+    sample is snapped to the nearest link going the same way, found among the few links near
+    its cell of a SegmentGridIndex, so the cost of a route grows with its length and not with
+    the size of the road network. Samples are then joined into the ordered links of the route,
+    smoothing over short detours onto crossing links.
+
+    It subscribes to the snapshot cache like the other indexes, and only links which appeared,
+    moved or disappeared since the last version are re-bucketed. Matching only reads immutable
+    state, so any number of threads can match routes at the same time.
+    """
+
+    def __init__(self, cell_size_m=200, max_distance_m=30, max_heading_diff=45, min_run_m=30):
+        """
+        :param max_distance_m: how far a point of a route may be from a link to be on it
+        :param max_heading_diff: degrees a link may turn away from the route to be on it
+        :param min_run_m: runs shorter than this on a link, between runs on the same other
+            link, are taken as part of the other link
+        """
+        self.lock = threading.Lock()
+        self.update_lock = threading.Lock()
+        self.grid = SegmentGridIndex(cell_size_m=cell_size_m)
+        self.max_distance_m = max_distance_m
+        self.max_heading_diff = max_heading_diff
+        self.min_run_m = min_run_m
+        self.geometry = pd.DataFrame(columns=GEOMETRY_COLUMNS, dtype=np.float64)
+        self.road_names = np.empty(0, dtype=object)  # road name of each row of the grid
+        self.snapshot = None
+
+    def on_snapshot(self, snapshot):
+        # updates are diffed against the previous version, so they must not interleave
+        with self.update_lock:
+            self.apply_snapshot(snapshot)
+
+    def apply_snapshot(self, snapshot):
+        if self.snapshot is not None and self.snapshot.version == snapshot.version:
+            # same data, only refreshed_at moved
+            self.snapshot = snapshot
+            return
+
+        links = snapshot.data.dropna(subset=["linkid", *GEOMETRY_COLUMNS])
+        links = links.drop_duplicates("linkid", keep="last").set_index("linkid")
+        geometry = links[GEOMETRY_COLUMNS].astype(np.float64)
+        previous = self.geometry.reindex(geometry.index)
+        changed = (previous != geometry).any(axis=1)  # true for new links too, as NaN != x
+        removed = self.geometry.index.difference(geometry.index)
+
+        moved = geometry[changed]
+        self.grid.update(
+            moved.index.tolist(),
+            moved["startlat"].to_numpy(),
+            moved["startlon"].to_numpy(),
+            moved["endlat"].to_numpy(),
+            moved["endlon"].to_numpy(),
+        )
+        self.grid.remove(removed.tolist())
+        road_names = np.full(len(self.grid.ids), None, dtype=object)
+        road_names[self.rows(links.index)] = links["roadname"].astype(object).to_numpy()
+        with self.lock:
+            self.geometry, self.road_names, self.snapshot = geometry, road_names, snapshot
+
+    def is_fresh(self):
+        return self.snapshot is not None and self.snapshot.is_fresh()
+
+    def rows(self, link_ids):
+        """
+        :returns: array of the row of each link in the grid, or -1 for unknown links. Rows
+            are never reused, so arrays of other values per row stay valid across updates.
+        """
+        positions = self.grid.positions
+        link_ids = np.asarray(link_ids, dtype=object).tolist()
+        return np.array([positions.get(link_id, -1) for link_id in link_ids], dtype=np.int64)
+
+    def match(self, polylines):
+        """
+        :param polylines: list of encoded polylines which together make up the route, e.g. the
+            polylines of its steps
+        :returns: MatchedRoute of the links the route runs on
+        """
+        decoded = [decode_polyline(polyline) for polyline in polylines if polyline]
+        lats = np.concatenate([np.empty(0)] + [lats for lats, _ in decoded])
+        lons = np.concatenate([np.empty(0)] + [lons for _, lons in decoded])
+        lats, lons, headings, lengths = sample_polyline(lats, lons, self.grid.project)
+
+        with self.lock:
+            road_names = self.road_names
+        _, rows, _ = self.grid.match(
+            lats, lons, headings, self.max_distance_m, self.max_heading_diff
+        )
+        # rows newer than the road names belong to an update still being swapped in
+        matched = (rows >= 0) & (rows < len(road_names))
+        runs, run_lengths = collapse_runs(rows[matched], lengths[matched])
+
+        # e.g. a few samples snapped to a crossing link in the middle of a junction
+        detours = 1 + np.flatnonzero(
+            (run_lengths[1:-1] < self.min_run_m) & (runs[:-2] == runs[2:])
+        )
+        runs[detours] = runs[detours - 1]
+        runs, run_lengths = collapse_runs(runs, run_lengths)
+
+        names, _ = collapse_runs(road_names[runs], run_lengths)
+        return MatchedRoute(
+            link_ids=self.grid.ids[runs].tolist(),
+            road_names=names.tolist(),
+            rows=runs,
+            lengths_m=run_lengths,
+            length_m=float(lengths.sum()),
+        )
@@ -0,0 +1,111 @@
+import dataclasses
+import datetime
+import threading
+from collections import defaultdict
+
+import pandas as pd
+
+# live tables read on every user query, which are kept in memory by the cache
+SNAPSHOT_TABLES = ["carpark", "trafficincidents", "roadworks", "trafficspeedbands", "vms"]
+
+
+@dataclasses.dataclass(frozen=True)
+class Snapshot:
+    """
+    Immutable copy of a table as of one refresh. The data must be treated as read-only, since
+    the same dataframe is handed to every reader.
+    """
+
+    table_name: str
+    version: int
+    data: pd.DataFrame
+    refreshed_at: datetime.datetime
+
+    def is_fresh(self, max_age=datetime.timedelta(hours=1)):
+        return self.refreshed_at is not None and datetime.datetime.now() - self.refreshed_at <= max_age
+
+
+class SnapshotCache:
+    """
+    Versioned in-process cache of the live tables, so that tools do not need a database round
+    trip on every user query. The ingestion path publishes the full table after every refresh
+    that changed it, which atomically swaps in a new snapshot with a higher version. Refreshes
+    that did not change anything only bump refreshed_at. Tables that have not been published
+    yet, e.g. right after startup, are loaded once through the loader function.
+
+    Other in-memory views of a table, such as spatial indexes, can subscribe to be called with
+    every new snapshot of that table.
+    """
+
+    def __init__(self, loader=None):
+        """
+        :param loader: function taking a table name and returning a tuple of
+            (dataframe of the table, time it was last refreshed)
+        """
+        self.loader = loader
+        self.snapshots = {}
+        self.listeners = defaultdict(list)
+        self.lock = threading.Lock()
+        self.load_locks = defaultdict(threading.Lock)
+        self.notify_locks = defaultdict(threading.Lock)
+
+    def subscribe(self, table_name, callback):
+        self.listeners[table_name].append(callback)
+
+    def publish(self, table_name, data, refreshed_at=None, only_if_missing=False):
+        """
+        :param only_if_missing: only publish if there is no snapshot of the table yet, e.g.
+            for data loaded from the database, which a refresh may have overtaken meanwhile
+        :returns: the latest snapshot of the table
+        """
+        with self.lock:
+            previous = self.snapshots.get(table_name)
+            if only_if_missing and previous is not None:
+                return previous
+            snapshot = Snapshot(
+                table_name=table_name,
+                version=previous.version + 1 if previous is not None else 1,
+                data=data,
+                refreshed_at=refreshed_at or datetime.datetime.now(),
+            )
+            self.snapshots[table_name] = snapshot
+        self.notify(table_name)
+        return snapshot
+
+    def touch(self, table_name, refreshed_at=None):
+        with self.lock:
+            previous = self.snapshots.get(table_name)
+            if previous is None:
+                return None
+            snapshot = dataclasses.replace(
+                previous, refreshed_at=refreshed_at or datetime.datetime.now()
+            )
+            self.snapshots[table_name] = snapshot
+        self.notify(table_name)
+        return snapshot
+
+    def get(self, table_name):
+        """
+        :returns: the latest snapshot of the table, or None if it could not be loaded
+        """
+        snapshot = self.snapshots.get(table_name)
+        if snapshot is not None or self.loader is None:
+            return snapshot
+
+        # only let one thread load each table, the others wait for it
+        with self.load_locks[table_name]:
+            snapshot = self.snapshots.get(table_name)
+            if snapshot is None:
+                data, refreshed_at = self.loader(table_name)
+                if data is not None:
+                    snapshot = self.publish(table_name, data, refreshed_at, only_if_missing=True)
+        return snapshot
+
+    def notify(self, table_name):
+        # listeners of a table are called one snapshot at a time and always with the latest
+        # one, so they never see versions out of order even when publishers race
+        with self.notify_locks[table_name]:
+            with self.lock:
+                snapshot = self.snapshots[table_name]
+            for callback in self.listeners[table_name]:
+                callback(snapshot)
@@ -0,0 +1,383 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+from utils.geo import haversine_m
+
+# metres per degree of latitude, and of longitude at the equator
+METRES_PER_DEGREE = 111320
+
+
+class GridIndex:
+    """
+    Immutable spatial index over a set of points, bucketing them into square cells of a uniform
+    grid laid over a local flat projection. Queries only compute exact haversine distances for
+    points in the cells around the query point, widening ring by ring until the answer is
+    guaranteed to be exact. For a city-sized area like Singapore the flat projection is accurate
+    to well within a cell, so both k-nearest and within-radius queries are exact.
+    """
+
+    def __init__(self, lats, lons, cell_size_m=500):
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.lons = np.asarray(lons, dtype=np.float64)
+        self.cell_size_m = cell_size_m
+        ref_lat = float(np.mean(self.lats)) if len(self.lats) > 0 else 0.0
+        self.lon_scale = METRES_PER_DEGREE * np.cos(np.radians(ref_lat))
+
+        cells_x, cells_y = self.to_cells(self.lats, self.lons)
+        self.cells = {}
+        if len(self.lats) > 0:
+            # sort points by cell so that each cell is one contiguous slice of indices
+            order = np.lexsort((cells_y, cells_x))
+            sorted_cells = np.stack([cells_x[order], cells_y[order]], axis=1)
+            starts = np.flatnonzero(np.any(np.diff(sorted_cells, axis=0) != 0, axis=1)) + 1
+            for chunk in np.split(order, starts):
+                self.cells[(cells_x[chunk[0]], cells_y[chunk[0]])] = chunk
+            self.min_x, self.max_x = cells_x.min(), cells_x.max()
+            self.min_y, self.max_y = cells_y.min(), cells_y.max()
+
+    def __len__(self):
+        return len(self.lats)
+
+    def to_cells(self, lats, lons):
+        x = np.floor(np.asarray(lons) * self.lon_scale / self.cell_size_m).astype(np.int64)
+        y = np.floor(np.asarray(lats) * METRES_PER_DEGREE / self.cell_size_m).astype(np.int64)
+        return x, y
+
+    def ring(self, cx, cy, r):
+        """
+        Point indices in the cells exactly r cells away from cell (cx, cy). Only cells inside
+        the bounding box of the points are visited, so far away rings stay cheap.
+        """
+        if r == 0:
+            coords = [(cx, cy)]
+        else:
+            ys = range(max(cy - r, self.min_y), min(cy + r, self.max_y) + 1)
+            xs = range(max(cx - r + 1, self.min_x), min(cx + r - 1, self.max_x) + 1)
+            coords = [(x, y) for x in (cx - r, cx + r) if self.min_x <= x <= self.max_x for y in ys]
+            coords += [(x, y) for y in (cy - r, cy + r) if self.min_y <= y <= self.max_y for x in xs]
+        chunks = [self.cells[coord] for coord in coords if coord in self.cells]
+        return np.concatenate(chunks) if chunks else np.empty(0, dtype=np.int64)
+
+    def ring_bounds(self, cx, cy):
+        """
+        :returns: tuple of the first and last rings around cell (cx, cy) which can have points
+        """
+        first = max(self.min_x - cx, cx - self.max_x, self.min_y - cy, cy - self.max_y, 0)
+        last = max(
+            abs(cx - self.min_x), abs(cx - self.max_x), abs(cy - self.min_y), abs(cy - self.max_y)
+        )
+        return first, last
+
+    def nearest(self, lat, lon, k):
+        """
+        :returns: tuple of (indices, distances in metres) of the k nearest points, nearest first
+        """
+        if len(self) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        cx, cy = (int(c) for c in self.to_cells(lat, lon))
+        first_ring, last_ring = self.ring_bounds(cx, cy)
+        candidates = np.empty(0, dtype=np.int64)
+        for r in range(first_ring, last_ring + 1):
+            candidates = np.concatenate([candidates, self.ring(cx, cy, r)])
+            if len(candidates) < k and r < last_ring:
+                continue
+            distances = haversine_m(lat, lon, self.lats[candidates], self.lons[candidates])
+            top = np.argsort(distances, kind="stable")[:k]
+            # every point not yet seen is at least r cells away from the query point
+            if r == last_ring or (len(top) == k and distances[top[-1]] <= r * self.cell_size_m):
+                return candidates[top], distances[top]
+
+    def within(self, lat, lon, radius_m):
+        """
+        :returns: tuple of (indices, distances in metres) of points within the radius, nearest first
+        """
+        if len(self) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        cx, cy = (int(c) for c in self.to_cells(lat, lon))
+        first_ring, last_ring = self.ring_bounds(cx, cy)
+        last_ring = min(int(np.ceil(radius_m / self.cell_size_m)), last_ring)
+        candidates = np.concatenate(
+            [np.empty(0, dtype=np.int64)]
+            + [self.ring(cx, cy, r) for r in range(first_ring, last_ring + 1)]
+        )
+        distances = haversine_m(lat, lon, self.lats[candidates], self.lons[candidates])
+        inside = np.flatnonzero(distances <= radius_m)
+        order = inside[np.argsort(distances[inside], kind="stable")]
+        return candidates[order], distances[order]
+
+
+class CarparkIndex:
+    """
+    In-memory nearest-carpark lookup over the latest carpark snapshot. It subscribes to the
+    snapshot cache, and the index is rebuilt from scratch whenever a new version of the carpark
+    table is published, then swapped in atomically so that readers always see a complete index.
+    Only car lots (lot type C) are indexed.
+    """
+
+    COLUMNS = ["carparkid", "development", "area", "availablelots", "latitude", "longitude"]
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.carparks = pd.DataFrame(columns=self.COLUMNS)
+        self.grid = GridIndex([], [])
+        self.snapshot = None
+
+    def on_snapshot(self, snapshot):
+        if self.snapshot is not None and self.snapshot.version == snapshot.version:
+            # same data, only refreshed_at moved
+            self.snapshot = snapshot
+            return
+
+        data = snapshot.data
+        carparks = data[(data["lottype"] == "C") & data["latitude"].notna() & data["longitude"].notna()]
+        carparks = carparks[self.COLUMNS].reset_index(drop=True)
+        grid = GridIndex(carparks["latitude"], carparks["longitude"])
+        with self.lock:
+            self.carparks, self.grid, self.snapshot = carparks, grid, snapshot
+
+    def is_fresh(self):
+        return self.snapshot is not None and self.snapshot.is_fresh()
+
+    def nearest(self, lat, lon, k=3):
+        """
+        :returns: dataframe of the k nearest carparks with their distance_m, nearest first
+        """
+        with self.lock:
+            carparks, grid = self.carparks, self.grid
+        indices, distances = grid.nearest(lat, lon, k)
+        return carparks.iloc[indices].assign(distance_m=distances).reset_index(drop=True)
+
+    def within(self, lat, lon, radius_m):
+        """
+        :returns: dataframe of carparks within the radius with their distance_m, nearest first
+        """
+        with self.lock:
+            carparks, grid = self.carparks, self.grid
+        indices, distances = grid.within(lat, lon, radius_m)
+        return carparks.iloc[indices].assign(distance_m=distances).reset_index(drop=True)
+
+
+class SegmentGridIndex:
+    """
+    Spatial index over directed line segments, such as road links, for finding the segment
+    each of many points lies on. Segments are bucketed into square cells of a uniform grid
+    over a fixed local flat projection, and each segment is registered in every cell within
+    one cell of a cell it passes through, so all segments within cell_size_m of a point are
+    found by looking up the cell of the point alone.
+
+    The index can be updated incrementally, which only re-buckets the segments that were
+    added, moved or removed. Cells are immutable arrays and every update swaps in a new
+    state, so readers never see a half updated index.
+    """
+
+    def __init__(self, cell_size_m=200, ref_lat=1.35):
+        """
+        :param cell_size_m: size of the cells, which bounds the distance of a match
+        :param ref_lat: latitude the projection is accurate at, by default that of Singapore.
+            It stays fixed so that incremental updates use the same projection.
+        """
+        self.cell_size_m = cell_size_m
+        self.lon_scale = METRES_PER_DEGREE * np.cos(np.radians(ref_lat))
+        self.lock = threading.Lock()
+        self.positions = {}  # segment id to its row
+        self.ids = np.empty(0, dtype=object)  # id of the segment in each row, None if removed
+        self.coords = np.empty((0, 4))  # x0, y0, x1, y1 of each row in metres
+        self.cells = {}  # cell key to the sorted rows of the segments near the cell
+
+    def __len__(self):
+        return len(self.positions)
+
+    def project(self, lats, lons):
+        return (
+            np.asarray(lons, dtype=np.float64) * self.lon_scale,
+            np.asarray(lats, dtype=np.float64) * METRES_PER_DEGREE,
+        )
+
+    def cell_keys(self, x, y):
+        cx = np.floor(x / self.cell_size_m).astype(np.int64)
+        cy = np.floor(y / self.cell_size_m).astype(np.int64)
+        return (cx << 32) + cy
+
+    def segment_cells(self, rows, coords):
+        """
+        :returns: tuple of (rows, cell keys) of every pair of a segment and a cell it is
+            registered in, without duplicates and sorted by cell key and then row
+        """
+        x0, y0, x1, y1 = coords.T
+        lengths = np.hypot(x1 - x0, y1 - y0)
+        # sample every half cell along each segment, so that no cell it crosses is skipped
+        samples = np.ceil(lengths / (self.cell_size_m / 2)).astype(np.int64) + 1
+        sample_rows = np.repeat(np.arange(len(rows)), samples)
+        starts = np.repeat(np.cumsum(samples) - samples, samples)
+        steps = np.maximum(np.repeat(samples, samples) - 1, 1)
+        t = (np.arange(len(sample_rows)) - starts) / steps
+        cx = np.floor((x0[sample_rows] + t * (x1 - x0)[sample_rows]) / self.cell_size_m)
+        cy = np.floor((y0[sample_rows] + t * (y1 - y0)[sample_rows]) / self.cell_size_m)
+
+        # register each segment in the neighbours of the cells it crosses as well
+        offsets = np.array([(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)])
+        cx = (cx.astype(np.int64)[:, None] + offsets[:, 0]).ravel()
+        cy = (cy.astype(np.int64)[:, None] + offsets[:, 1]).ravel()
+        segment_rows = np.repeat(np.asarray(rows)[sample_rows], len(offsets))
+        keys = (cx << 32) + cy
+        order = np.lexsort((segment_rows, keys))
+        segment_rows, keys = segment_rows[order], keys[order]
+        unique = np.ones(len(keys), dtype=bool)
+        unique[1:] = (np.diff(keys) != 0) | (np.diff(segment_rows) != 0)
+        return segment_rows[unique], keys[unique]
+
+    def update(self, ids, lats0, lons0, lats1, lons1):
+        """
+        Adds segments, or moves the ones with ids already in the index.
+
+        :param ids: list of segment ids
+        :param lats0: latitudes of the start of each segment, and so on for the others
+        """
+        x0, y0 = self.project(lats0, lons0)
+        x1, y1 = self.project(lats1, lons1)
+        new_coords = np.stack([x0, y0, x1, y1], axis=1)
+        with self.lock:
+            known = np.array([id_ in self.positions for id_ in ids], dtype=bool)
+            ids = np.asarray(ids, dtype=object)
+            moved_rows = np.array([self.positions[id_] for id_ in ids[known]], dtype=np.int64)
+            added_ids = ids[~known]
+            added_rows = np.arange(len(self.ids), len(self.ids) + len(added_ids))
+
+            coords = np.concatenate([self.coords, new_coords[~known]])
+            coords[moved_rows] = new_coords[known]
+            segment_ids = np.concatenate([self.ids, added_ids])
+            positions = {**self.positions, **dict(zip(added_ids, added_rows.tolist()))}
+
+            removed = None
+            if len(moved_rows) > 0:
+                removed = self.segment_cells(moved_rows, self.coords[moved_rows])
+            rows = np.concatenate([moved_rows, added_rows])
+            added = self.segment_cells(rows, coords[rows]) if len(rows) > 0 else None
+            cells = self.rebucket(removed, added)
+            self.coords, self.ids, self.positions, self.cells = coords, segment_ids, positions, cells
+
+    def remove(self, ids):
+        with self.lock:
+            rows = np.array(
+                [self.positions[id_] for id_ in ids if id_ in self.positions], dtype=np.int64
+            )
+            if len(rows) == 0:
+                return
+            removed = self.segment_cells(rows, self.coords[rows])
+            segment_ids = self.ids.copy()
+            segment_ids[rows] = None
+            positions = {
+                id_: row for id_, row in self.positions.items() if segment_ids[row] is not None
+            }
+            cells = self.rebucket(removed, None)
+            self.ids, self.positions, self.cells = segment_ids, positions, cells
+
+    def rebucket(self, removed, added):
+        """
+        :param removed: tuple of (rows, cell keys) of segments to take out of cells as given
+            by segment_cells, or None
+        :param added: tuple of (rows, cell keys) of segments to put into cells as given by
+            segment_cells, or None
+        :returns: new dict of cells, sharing every cell which did not change
+        """
+        empty = np.empty(0, dtype=np.int64)
+        removed_rows, removed_keys = removed if removed is not None else (empty, empty)
+        added_rows, added_keys = added if added is not None else (empty, empty)
+        touched = np.unique(np.concatenate([removed_keys, added_keys]))
+        current = [self.cells.get(key, empty) for key in touched.tolist()]
+        current_rows = np.concatenate([empty] + current)
+        current_keys = np.repeat(touched, [len(rows) for rows in current])
+
+        # every pair to remove is also a current pair, and sorts right after it
+        rows = np.concatenate([current_rows, removed_rows])
+        keys = np.concatenate([current_keys, removed_keys])
+        is_removal = np.arange(len(rows)) >= len(current_rows)
+        order = np.lexsort((is_removal, rows, keys))
+        rows, keys, is_removal = rows[order], keys[order], is_removal[order]
+        kept = ~is_removal
+        kept[:-1] &= ~is_removal[1:]
+
+        rows = np.concatenate([rows[kept], added_rows])
+        keys = np.concatenate([keys[kept], added_keys])
+        order = np.lexsort((rows, keys))
+        rows, keys = rows[order], keys[order]
+        unique = np.ones(len(keys), dtype=bool)
+        unique[1:] = (np.diff(keys) != 0) | (np.diff(rows) != 0)
+        rows, keys = rows[unique], keys[unique]
+
+        cells = dict(self.cells)
+        for key in touched.tolist():
+            cells.pop(key, None)
+        if len(keys) > 0:
+            starts = np.concatenate([[0], np.flatnonzero(np.diff(keys)) + 1])
+            ends = np.append(starts[1:], len(keys)).tolist()
+            cells.update(
+                (key, rows[start:end])
+                for key, start, end in zip(keys[starts].tolist(), starts.tolist(), ends)
+            )
+        return cells
+
+    def match(self, lats, lons, headings=None, max_distance_m=25, max_heading_diff=45):
+        """
+        Finds the nearest segment to each point, going the same way if headings are given.
+
+        :param lats: latitudes of the points
+        :param lons: longitudes of the points
+        :param headings: array of (dx, dy) directions of travel at each point, in the
+            projection of the index, or None to ignore directions
+        :param max_distance_m: points further than this from every segment are not matched,
+            at most cell_size_m
+        :param max_heading_diff: degrees a matched segment may turn away from the heading
+        :returns: tuple of (ids, rows, distances) with one entry per point, where points
+            without a match have id None, row -1 and distance inf
+        """
+        with self.lock:
+            coords, segment_ids, cells = self.coords, self.ids, self.cells
+        x, y = self.project(lats, lons)
+        rows = np.full(len(x), -1, dtype=np.int64)
+        distances = np.full(len(x), np.inf)
+        if len(x) == 0 or len(cells) == 0:
+            return np.full(len(x), None, dtype=object), rows, distances
+
+        # pair every point with every segment registered in its cell, so that all pairs are
+        # measured at once, with candidates bounded by the segments near a single cell
+        unique_keys, inverse = np.unique(self.cell_keys(x, y), return_inverse=True)
+        empty = np.empty(0, dtype=np.int64)
+        cell_rows = [cells.get(key, empty) for key in unique_keys.tolist()]
+        cell_sizes = np.array([len(chunk) for chunk in cell_rows], dtype=np.int64)
+        cell_starts = np.cumsum(cell_sizes) - cell_sizes
+        counts = cell_sizes[inverse]
+        if counts.sum() == 0:
+            return np.full(len(x), None, dtype=object), rows, distances
+        points = np.repeat(np.arange(len(x)), counts)
+        offsets = np.arange(len(points)) - np.repeat(np.cumsum(counts) - counts, counts)
+        candidates = np.concatenate(cell_rows)[np.repeat(cell_starts[inverse], counts) + offsets]
+
+        x0, y0, x1, y1 = coords[candidates].T
+        dx, dy = x1 - x0, y1 - y0
+        length_sq = np.maximum(dx * dx + dy * dy, 1e-9)
+        px, py = x[points], y[points]
+        t = np.clip(((px - x0) * dx + (py - y0) * dy) / length_sq, 0, 1)
+        d = np.hypot(px - (x0 + t * dx), py - (y0 + t * dy))
+        if headings is not None:
+            headings = np.asarray(headings, dtype=np.float64)
+            hx, hy = headings[points, 0], headings[points, 1]
+            norms = np.hypot(hx, hy) * np.sqrt(length_sq)
+            cos = (hx * dx + hy * dy) / np.maximum(norms, 1e-9)
+            # points without a heading, e.g. repeated points, can match either way
+            d = np.where((cos >= np.cos(np.radians(max_heading_diff))) | (norms == 0), d, np.inf)
+
+        # the nearest candidate of each point, the first one in its cell on ties
+        has_candidates = counts > 0
+        nearest = np.minimum.reduceat(d, (np.cumsum(counts) - counts)[has_candidates])
+        best = np.flatnonzero(d == np.repeat(nearest, counts[has_candidates]))
+        best = best[np.concatenate([[True], np.diff(points[best]) != 0])]
+        matched = d[best] <= max_distance_m
+        rows[points[best[matched]]] = candidates[best[matched]]
+        distances[points[best[matched]]] = d[best[matched]]
+
+        ids = np.full(len(x), None, dtype=object)
+        ids[rows >= 0] = segment_ids[rows[rows >= 0]]
+        return ids, rows, distances
@@ -0,0 +1,129 @@
+import dataclasses
+import threading
+
+import numpy as np
+import pandas as pd
+
+from data.MapMatcher import MapMatcher
+
+# speed in km/h traffic is assumed to flow at when uncongested, by road category. Datamall
+# has used both letters (v2) and numbers (v3) for the same categories.
+FREE_FLOW_KMH = {
+    "A": 80, "1": 80,  # expressways
+    "B": 60, "2": 60,  # major arterial roads
+    "C": 50, "3": 50,  # arterial roads
+    "D": 40, "4": 40,  # minor arterial roads
+    "E": 30, "5": 30,  # small roads
+    "F": 40, "6": 40,  # slip roads
+    "G": 50, "8": 50,  # short tunnels and others
+}
+DEFAULT_FREE_FLOW_KMH = 50
+# the highest speed band, traffic at 70km/h or more
+MAX_SPEED_BAND = 8
+
+
+@dataclasses.dataclass(slots=True)
+class RouteCongestion:
+    score: float  # 0 when every matched link flows freely, up to 100 when all are at a standstill
+    speed_band: float  # mean speed band of the matched links, weighted by length
+    delay_s: float  # estimated time lost to traffic compared to free-flowing roads
+    matched_fraction: float  # fraction of the length of the route matched to a speed band link
+    length_m: float  # length of the route
+
+
+class SpeedBandIndex:
+    """
+    Live speed bands of LTA road links, for scoring the traffic along routes. Routes are
+    snapped to the links by a MapMatcher, which this index keeps up to date: it subscribes to
+    the snapshot cache like the other indexes and passes every snapshot on to the matcher,
+    which only re-buckets links that appeared, moved or disappeared. The speed bands of all
+    links, which change on every refresh, are swapped in as plain arrays by row of the matcher.
+    """
+
+    def __init__(self, matcher=None):
+        """
+        :param matcher: MapMatcher of the speed band links, a new one by default
+        """
+        self.lock = threading.Lock()
+        self.matcher = matcher if matcher is not None else MapMatcher()
+        # speed band, estimated speed and free-flow speed in km/h of each row of the matcher
+        self.bands, self.speeds, self.free_flow = (np.empty(0) for _ in range(3))
+        self.snapshot = None
+
+    def on_snapshot(self, snapshot):
+        self.matcher.on_snapshot(snapshot)
+        if self.snapshot is not None and self.snapshot.version == snapshot.version:
+            # same data, only refreshed_at moved
+            self.snapshot = snapshot
+            return
+
+        links = snapshot.data.drop_duplicates("linkid", keep="last")
+        rows = self.matcher.rows(links["linkid"])
+        known = rows >= 0
+        # rows of links which are not in this snapshot get NaN and are ignored
+        bands, speeds, free_flow = (np.full(len(self.matcher.grid.ids), np.nan) for _ in range(3))
+        bands[rows[known]], speeds[rows[known]], free_flow[rows[known]] = (
+            values[known] for values in self.link_speeds(links)
+        )
+        with self.lock:
+            self.bands, self.speeds, self.free_flow = bands, speeds, free_flow
+            self.snapshot = snapshot
+
+    def link_speeds(self, links):
+        """
+        :returns: tuple of arrays of the speed band, estimated speed and free-flow speed in
+            km/h of each link. The estimated speed is the middle of the range of its band, at
+            most the free-flow speed, as the top band has no upper bound.
+        """
+        def numeric(column):
+            values = pd.to_numeric(links[column], errors="coerce")
+            return values.to_numpy(np.float64, na_value=np.nan)
+
+        bands, minimum, maximum = (
+            numeric(column) for column in ("speedband", "minimumspeed", "maximumspeed")
+        )
+        free_flow = (
+            links["roadcategory"].astype(str).map(FREE_FLOW_KMH).fillna(DEFAULT_FREE_FLOW_KMH)
+        ).to_numpy(np.float64)
+        # band n covers speeds from 10 * (n - 1) up to 10 * n km/h
+        speeds = np.where(
+            np.isnan(minimum) | np.isnan(maximum), bands * 10 - 5, (minimum + maximum) / 2
+        )
+        return bands, np.clip(speeds, 1, free_flow), free_flow
+
+    def is_fresh(self):
+        return self.snapshot is not None and self.snapshot.is_fresh()
+
+    def congestion(self, polylines):
+        """
+        Scores the live traffic along a route from the speed bands of the links it runs on,
+        weighted by the length driven on each link.
+
+        :param polylines: list of encoded polylines which together make up the route, e.g. the
+            polylines of its steps
+        :returns: RouteCongestion of the route, where score and speed_band are NaN if no part
+            of it could be matched
+        """
+        with self.lock:
+            bands, speeds, free_flow = self.bands, self.speeds, self.free_flow
+        route = self.matcher.match(polylines)
+        # rows newer than the speed arrays belong to an update still being swapped in
+        on_links = route.rows < len(bands)
+        rows, lengths_on_links = route.rows[on_links], route.lengths_m[on_links]
+        known = ~np.isnan(bands[rows])
+        rows, lengths_on_links = rows[known], lengths_on_links[known]
+
+        matched_length = lengths_on_links.sum()
+        length = route.length_m
+        if matched_length == 0:
+            return RouteCongestion(np.nan, np.nan, 0.0, 0.0, float(length))
+        speed_band = float(np.average(bands[rows], weights=lengths_on_links))
+        # metres over km/h gives thousandths of an hour, which 3.6 converts to seconds
+        delay_s = 3.6 * (lengths_on_links / speeds[rows] - lengths_on_links / free_flow[rows]).sum()
+        return RouteCongestion(
+            score=100 * (MAX_SPEED_BAND - speed_band) / (MAX_SPEED_BAND - 1),
+            speed_band=speed_band,
+            delay_s=float(max(delay_s, 0.0)),
+            matched_fraction=float(matched_length / length),
+            length_m=float(length),
+        )
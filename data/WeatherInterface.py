@@ -2,9 +2,12 @@ import os
 import requests
 import json
 import datetime
+import hashlib
 
 import pandas as pd
 
+from http_client import http_client
+
 
 class WeatherInterface:
     """
@@ -21,6 +24,7 @@ class WeatherInterface:
             "rainfall": "environment/rainfall",
             "weatherforecast": "environment/2-hour-weather-forecast",
         }  # the keys here are the corresponding table names in the database
+        self.payload_hashes = {}  # hash of the raw response of the last call of each API
 
     def call(self, api_name):
         """
@@ -32,7 +36,7 @@ class WeatherInterface:
         :raises HTTPError: if API call fails
         """
         api_url = self.base_url + self.api_urls[api_name]
-        response = requests.get(api_url)
+        response = http_client().get(api_url)
 
         # check success of API call to avoid bad data
         if response.status_code != 200:
@@ -40,6 +44,9 @@ class WeatherInterface:
 
         # our tables are in the same schema as the response data
         # directly convert to a dataframe using pd.DataFrame.from_records
+        self.payload_hashes[api_name] = hashlib.blake2b(
+            response.content, digest_size=16
+        ).hexdigest()
         res_val = json.loads(response.text)
         if api_name == "airtemp":
             data = self.unpack_air_temp(res_val)
@@ -203,8 +210,9 @@ class WeatherInterface:
             for region in data["region_metadata"]:
                 region_name = region["name"]
                 areas = ", ".join(region_to_areas.get(region_name, []))
-                psi_value = psi_readings.get(region_name, "N/A")
-                psi_band = get_psi_band(psi_value) if psi_value != "N/A" else "N/A"
+                # missing readings are left empty since the psi column is an integer
+                psi_value = psi_readings.get(region_name)
+                psi_band = get_psi_band(psi_value) if psi_value is not None else "N/A"
                 df_data.append(
                     {
                         "region": region_name,
@@ -214,7 +222,9 @@ class WeatherInterface:
                         "timestamp": current_timestamp,
                     }
                 )
-        return pd.DataFrame(df_data)
+        data = pd.DataFrame(df_data)
+        data["psi"] = data["psi"].astype("Int64")
+        return data
 
     def download_local(self, api_name, output_file):
         """
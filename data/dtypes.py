@@ -0,0 +1,89 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+from utils.all_tables_query import CREATE_TABLES_QUERY
+
+# text columns with few distinct values, which are much smaller as categoricals
+CATEGORICAL_COLUMNS = {
+    "agency",
+    "area",
+    "daytype",
+    "lottype",
+    "region",
+    "roadcategory",
+    "roadname",
+    "svcdept",
+    "type",
+    "vehicletype",
+    "zoneid",
+}
+# nullable integer dtypes, so that a column keeps its dtype across refreshes with missing values
+INTEGER_TYPES = {"SMALLINT": "Int16", "INT": "Int32", "INTEGER": "Int32", "BIGINT": "Int64"}
+# integer columns whose values are known to be small enough for an even smaller type
+INTEGER_OVERRIDES = {
+    "availablelots": "Int16",
+    "direction": "Int8",
+    "maximumspeed": "Int16",
+    "minimumspeed": "Int16",
+    "speedband": "Int8",
+}
+FLOAT_TYPES = {"DECIMAL", "REAL", "DOUBLE PRECISION"}
+DATETIME_TYPES = {"TIMESTAMP", "DATE"}
+
+
+def parse_table_schemas(query):
+    """
+    Reads the column types of every table out of CREATE TABLE statements.
+
+    :param query: string of CREATE TABLE statements, such as CREATE_TABLES_QUERY
+    :returns: dictionary of table name to a dictionary of column name to SQL type
+    """
+    schemas = {}
+    tables = re.findall(
+        r"CREATE TABLE (?:IF NOT EXISTS )?(\w+)\s*\((.*?)\)\s*;",
+        query,
+        flags=re.DOTALL,
+    )
+    for table_name, body in tables:
+        columns = {}
+        for line in body.split(","):
+            match = re.match(r"\s*(\w+)\s+([A-Z][A-Z ]*[A-Z])", line)
+            if match and match.group(1).upper() not in ("PRIMARY", "UNIQUE"):
+                column_type = match.group(2).replace(" PRIMARY KEY", "").strip()
+                columns[match.group(1)] = column_type
+        schemas[table_name] = columns
+    return schemas
+
+
+TABLE_SCHEMAS = parse_table_schemas(CREATE_TABLES_QUERY)
+
+
+def apply_schema_dtypes(df, table_name):
+    """
+    Converts the columns of a freshly fetched table to compact dtypes based on the column
+    types declared for that table in CREATE_TABLES_QUERY. Integers become nullable integers
+    of the declared size or smaller (see INTEGER_OVERRIDES), decimals become float32,
+    timestamps and dates become datetimes and low-cardinality text becomes categorical.
+    Columns which are not declared for the table are left as they are.
+
+    :param df: dataframe with columns named as in the table
+    :param table_name: the name of the table the data is for
+    :returns: the same dataframe, converted in place
+    """
+    schema = TABLE_SCHEMAS.get(table_name, {})
+    for col, column_type in schema.items():
+        if col not in df.columns:
+            continue
+        if column_type in INTEGER_TYPES:
+            dtype = INTEGER_OVERRIDES.get(col, INTEGER_TYPES[column_type])
+            df[col] = pd.to_numeric(df[col], errors="coerce").astype(dtype)
+        elif column_type in FLOAT_TYPES:
+            df[col] = pd.to_numeric(df[col], errors="coerce").astype(np.float32)
+        elif column_type in DATETIME_TYPES:
+            df[col] = pd.to_datetime(df[col], errors="coerce", format="mixed")
+        elif column_type == "TEXT" and col in CATEGORICAL_COLUMNS:
+            df[col] = df[col].astype("category")
+    return df
+
@@ -0,0 +1,86 @@
+import codecs
+import json
+import re
+
+import pandas as pd
+
+_DECODER = json.JSONDecoder()
+_WHITESPACE = re.compile(r"[\s,]*")
+
+
+def iter_array_items(chunks, key):
+    """
+    Incrementally decodes the items of the array stored under key in a top-level JSON object,
+    such as the "value" array of Datamall responses. Items are decoded one at a time as the
+    chunks arrive, so neither the full response text nor the full list of items is ever held
+    in memory. Everything outside of the array is skipped.
+
+    :param chunks: iterable of bytes of the JSON document, e.g. response.iter_content()
+    :param key: key of the array in the top-level object
+    :returns: generator of decoded array items
+    :raises ValueError: if the array is not found or the document is malformed
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    chunks = iter(chunks)
+    array_start = re.compile(r'"' + re.escape(key) + r'"\s*:\s*\[')
+
+    # read until the start of the array
+    buffer = ""
+    while (match := array_start.search(buffer)) is None:
+        chunk = next(chunks, None)
+        if chunk is None:
+            raise ValueError(f"Array {key} not found in JSON document")
+        buffer += decoder.decode(chunk)
+    pos = match.end()
+
+    while True:
+        pos = _WHITESPACE.match(buffer, pos).end()
+        if pos < len(buffer) and buffer[pos] == "]":
+            return
+        try:
+            item, end = _DECODER.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            # the item is cut off at the end of the buffer, read in the next chunk
+            chunk = next(chunks, None)
+            if chunk is None:
+                raise ValueError(f"Array {key} is incomplete or malformed")
+            buffer = buffer[pos:] + decoder.decode(chunk)
+            pos = 0
+            continue
+        yield item
+        pos = end
+
+
+class ColumnBuffer:
+    """
+    Collects records into one list per column instead of one dict per record, so records can be
+    dropped as soon as they are read. Columns missing from a record are filled with None.
+    """
+
+    def __init__(self):
+        self.columns = {}
+        self.num_rows = 0
+
+    def extend(self, records):
+        """
+        :param records: iterable of dicts
+        :returns: number of records added
+        """
+        start = self.num_rows
+        for record in records:
+            for col, value in record.items():
+                if col not in self.columns:
+                    self.columns[col] = [None] * self.num_rows
+                self.columns[col].append(value)
+            self.num_rows += 1
+            # pad the columns this record did not have
+            for values in self.columns.values():
+                if len(values) < self.num_rows:
+                    values.append(None)
+        return self.num_rows - start
+
+    def to_frame(self):
+        data = pd.DataFrame(self.columns)
+        self.columns = {}
+        self.num_rows = 0
+        return data
@@ -1,12 +1,39 @@
+import asyncio
+import datetime
+import io
+
 import dotenv
 import pandas as pd
 from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import create_async_engine
 
 from aws import AWS
 from data.WeatherInterface import WeatherInterface
 from data.DatamallInterface import DatamallInterface
-from utils.all_tables_query import CREATE_TABLES_QUERY, DROP_TABLES_QUERY
+from data.ChangeDetector import ChangeDetector
+from data.SpatialIndex import CarparkIndex
+from data.SnapshotCache import SNAPSHOT_TABLES, SnapshotCache
+from data.IncidentIndex import IncidentIndex
+from data.MapMatcher import MapMatcher
+from data.SpeedBandIndex import SpeedBandIndex
+from data.dtypes import apply_schema_dtypes
+from utils.all_tables_query import (
+    CREATE_TABLES_QUERY,
+    DROP_TABLES_QUERY,
+    MARK_REFRESHED_QUERY,
+    TABLE_KEYS,
+)
+from utils.history_tables_query import (
+    CREATE_HISTORY_TABLES_QUERY,
+    CREATE_PARTITION_QUERY,
+    HISTORY_RETENTION_DAYS,
+    HISTORY_TABLES,
+    LIST_PARTITIONS_QUERY,
+    partition_name,
+)
 
+from utils.geo import geohash_cell_size, geohash_neighbourhood
+from utils.road_names import normalize_road_name
 from custom_logger import logger
 
 config = dotenv.dotenv_values(".env")
@@ -24,6 +51,7 @@ class DataManager:
         if config["IS_TEST_ENV"] == "1":
             logger.info("Starting application in TEST environment")
             self.database = Database()
+            self.async_database = AsyncDatabase()
         else:
             logger.info("Starting application in PROD environment")
             self.aws = AWS()
@@ -32,6 +60,7 @@ class DataManager:
             endpoint, port = self.aws.rds.readInstance(instance_id[0])
             print(endpoint, port)
             self.database = Database(endpoint=endpoint, port=port)
+            self.async_database = AsyncDatabase(endpoint=endpoint, port=port)
 
         # Expose connection string for initialization of Langchain SQL toolkit
         self.connection_str = self.database.connection_str
@@ -59,6 +88,16 @@ class DataManager:
             "rainfall",
             "weatherforecast",
         ]
+        self.change_detector = ChangeDetector()
+        self.snapshots = SnapshotCache(loader=self.load_snapshot)
+        self.carpark_index = CarparkIndex()
+        self.snapshots.subscribe("carpark", self.carpark_index.on_snapshot)
+        self.incident_index = IncidentIndex()
+        self.snapshots.subscribe("trafficincidents", self.incident_index.on_snapshot)
+        # the speed band index keeps the map matcher up to date with the same snapshots
+        self.map_matcher = MapMatcher()
+        self.speedband_index = SpeedBandIndex(self.map_matcher)
+        self.snapshots.subscribe("trafficspeedbands", self.speedband_index.on_snapshot)
 
     def full_db_refresh(self):
         self.database.drop_all_tables()
@@ -68,25 +107,262 @@ class DataManager:
         for api_name in self.weather_apis:
             self.update_table(api_name)
 
-    def query(self, query):
-        return pd.DataFrame(self.database.run_query(query))
+    def query(self, query, params=None, table_name=None):
+        return self.database.fetch(query, params=params, table_name=table_name)
+
+    async def aquery(self, query, params=None, table_name=None):
+        """
+        Like query, but awaits the database instead of blocking the calling thread.
+        """
+        return await self.async_database.fetch(query, params=params, table_name=table_name)
+
+    def incidents_on_roads(self, roads, max_age=datetime.timedelta(hours=1)):
+        """
+        Finds the traffic incidents on any of the given roads which were reported recently.
+        This is answered from the in-memory incident index when it is fresh, and otherwise
+        from the indexed roads and reported_at columns of the table.
+
+        :param roads: list of road names
+        :param max_age: how long ago incidents can have been reported
+        :returns: dataframe of matching incidents, oldest first
+        """
+        since = datetime.datetime.now() - max_age
+
+        # make sure the index has been built from the latest snapshot
+        self.snapshot("trafficincidents")
+        if self.incident_index.is_fresh():
+            return self.recent_indexed_incidents(roads, since)
+        return self.query(*self.incidents_on_roads_query(roads, since))
+
+    async def aincidents_on_roads(self, roads, max_age=datetime.timedelta(hours=1)):
+        """
+        Like incidents_on_roads, but awaits the database instead of blocking the calling thread.
+        """
+        since = datetime.datetime.now() - max_age
+
+        await self.asnapshot("trafficincidents")
+        if self.incident_index.is_fresh():
+            return self.recent_indexed_incidents(roads, since)
+        return await self.aquery(*self.incidents_on_roads_query(roads, since))
+
+    def recent_indexed_incidents(self, roads, since):
+        incidents = self.incident_index.on_roads(roads)
+        return incidents[incidents["reported_at"] >= since].sort_values(
+            "reported_at", kind="stable"
+        )
+
+    def incidents_on_roads_query(self, roads, since):
+        """
+        :returns: tuple of (query, params, table_name) finding incidents on the roads since a time
+        """
+        return (
+            """
+            SELECT * FROM trafficincidents
+            WHERE roads && CAST(:roads AS TEXT[]) AND reported_at >= :since
+            ORDER BY reported_at
+            """,
+            {"roads": [normalize_road_name(road) for road in roads], "since": since},
+            "trafficincidents",
+        )
+
+    def match_route(self, polylines):
+        """
+        Finds the LTA road links a route runs on, in order, see MapMatcher.match.
+
+        :param polylines: list of encoded polylines which together make up the route
+        :returns: MatchedRoute of the route, or None if the road links are not fresh
+        """
+        # make sure the matcher has been built from the latest snapshot
+        self.snapshot("trafficspeedbands")
+        if not self.map_matcher.is_fresh():
+            return None
+        return self.map_matcher.match(polylines)
+
+    def route_congestion(self, polylines):
+        """
+        Scores the live traffic along a route from the speed bands of the road links it runs
+        on, see SpeedBandIndex.congestion. Matching routes to links needs the in-memory index,
+        so there is no database fallback.
+
+        :param polylines: list of encoded polylines which together make up the route
+        :returns: RouteCongestion of the route, or None if the speed bands are not fresh
+        """
+        # make sure the index has been built from the latest snapshot
+        self.snapshot("trafficspeedbands")
+        if not self.speedband_index.is_fresh():
+            return None
+        return self.speedband_index.congestion(polylines)
+
+    def nearest_carparks(self, lat, lon, k=3):
+        """
+        Finds the k carparks with car lots nearest to a point, among those refreshed within
+        the last hour. This is answered from the in-memory carpark index when it is fresh.
+        Otherwise only carparks in the geohash cells around the point are queried, widening
+        to larger cells and then to every carpark until k carparks are found which are nearer
+        than the distance the searched cells are guaranteed to cover.
+
+        :param lat: latitude of the point
+        :param lon: longitude of the point
+        :param k: number of carparks to return
+        :returns: dataframe of the nearest carparks with their distance_m, nearest first
+        """
+        # make sure the index has been built from the latest snapshot
+        self.snapshot("carpark")
+        if self.carpark_index.is_fresh():
+            return self.carpark_index.nearest(lat, lon, k)
+
+        for query, params, covered_m in self.nearest_carparks_queries(lat, lon, k):
+            carparks = self.query(query, params=params)
+            if len(carparks) == k and carparks["distance_m"].iloc[-1] <= covered_m:
+                return carparks
+        return carparks
+
+    async def anearest_carparks(self, lat, lon, k=3):
+        """
+        Like nearest_carparks, but awaits the database instead of blocking the calling thread.
+        """
+        await self.asnapshot("carpark")
+        if self.carpark_index.is_fresh():
+            return self.carpark_index.nearest(lat, lon, k)
+
+        for query, params, covered_m in self.nearest_carparks_queries(lat, lon, k):
+            carparks = await self.aquery(query, params=params)
+            if len(carparks) == k and carparks["distance_m"].iloc[-1] <= covered_m:
+                return carparks
+        return carparks
+
+    def nearest_carparks_queries(self, lat, lon, k):
+        """
+        :returns: generator of tuples of (query, params, distance in metres the query is
+            guaranteed to cover) over ever larger areas around the point, see nearest_carparks
+        """
+        point = {"lat": lat, "lon": lon, "k": k}
+        for precision in (6, 5, None):
+            if precision is None:
+                cell_filter, covered_m = "TRUE", float("inf")
+                params = point
+            else:
+                # the geohash column is precision 6, so larger cells are matched by prefix
+                column = "geohash" if precision == 6 else f"LEFT(geohash, {precision})"
+                cell_filter = f"{column} = ANY(:cells)"
+                # about 111km per degree, Singapore is close enough to the equator
+                covered_m = min(geohash_cell_size(precision)) * 111000
+                params = {**point, "cells": geohash_neighbourhood(lat, lon, precision)}
+
+            query = f"""
+                SELECT * FROM (
+                    SELECT *, 2 * 6371000 * ASIN(SQRT(
+                        POWER(SIN(RADIANS(latitude - :lat) / 2), 2)
+                        + COS(RADIANS(:lat)) * COS(RADIANS(latitude))
+                        * POWER(SIN(RADIANS(longitude - :lon) / 2), 2)
+                    )) AS distance_m
+                    FROM carpark
+                    WHERE {cell_filter} AND lottype = 'C' AND (NOW() - INTERVAL '1 hours') <= (
+                        SELECT refreshed_at FROM ingestion_state WHERE table_name = 'carpark'
+                    )
+                ) nearby
+                ORDER BY distance_m LIMIT :k
+                """
+            yield query, params, covered_m
 
     def update_table(self, api_name):
+        """
+        Refreshes a table from its API, writing only what changed since the last refresh.
+        If the raw response is the same as last time, only the freshness marker of the table
+        in ingestion_state is bumped.
+        """
         if api_name in self.datamall_apis:
-            data = self.datamall.call(api_name)
+            interface = self.datamall
         elif api_name in self.weather_apis:
-            data = self.weather.call(api_name)
+            interface = self.weather
         else:
             raise KeyError(f"Datamall API {api_name} is not available!")
 
-        self.database.update_table_from_df(data, api_name)
+        data = interface.call(api_name)
+        payload_hash = interface.payload_hashes[api_name]
+        if self.change_detector.payload_unchanged(api_name, payload_hash):
+            if self.database.mark_refreshed(api_name, payload_hash):
+                self.on_refreshed(api_name, None)
+            return
+
+        data = apply_schema_dtypes(data, api_name)
+
+        # without fingerprints to diff against, e.g. after a restart, the whole feed is written
+        # and every row which is not in it is deleted, whenever it disappeared
+        full_sync = not self.change_detector.has_fingerprints(api_name)
+        changed, removed_keys, row_hashes = self.change_detector.diff(
+            api_name, data, TABLE_KEYS.get(api_name)
+        )
+        if len(changed) == 0 and removed_keys is None and not full_sync:
+            success = self.database.mark_refreshed(api_name, payload_hash)
+        else:
+            logger.info(f"Writing {len(changed)} changed rows to {api_name}")
+            success = self.database.update_table_from_df(
+                changed, api_name, payload_hash, removed_keys, full_sync
+            )
+
+        if success:
+            self.change_detector.commit(api_name, payload_hash, row_hashes)
+            self.on_refreshed(api_name, data)
+
+    def on_refreshed(self, api_name, data):
+        """
+        Keeps the snapshot cache in step with the database after a refresh.
+
+        :param api_name: the name of the refreshed table
+        :param data: dataframe of the full table, or None if it did not change
+        """
+        if api_name not in SNAPSHOT_TABLES:
+            return
+        if data is None:
+            self.snapshots.touch(api_name)
+        else:
+            self.snapshots.publish(api_name, data)
+
+    def snapshot(self, table_name):
+        """
+        :returns: the latest in-memory snapshot of a live table, see SnapshotCache
+        """
+        return self.snapshots.get(table_name)
+
+    async def asnapshot(self, table_name):
+        """
+        Like snapshot, but a table which still has to be loaded from the database is loaded
+        in a worker thread instead of blocking the event loop.
+        """
+        snapshot = self.snapshots.snapshots.get(table_name)
+        if snapshot is not None:
+            return snapshot
+        return await asyncio.to_thread(self.snapshots.get, table_name)
+
+    def load_snapshot(self, table_name):
+        """
+        Loads a live table from the database for the snapshot cache, e.g. after a restart.
+
+        :returns: tuple of (dataframe of the table, time it was last refreshed)
+        """
+        logger.info(f"Loading snapshot of {table_name} from database")
+        try:
+            data = self.query(f"SELECT * FROM {table_name}", table_name=table_name)
+            state = self.query(
+                "SELECT refreshed_at FROM ingestion_state WHERE table_name = :table_name",
+                params={"table_name": table_name},
+            )
+        except Exception as err:
+            logger.error(f"Error loading snapshot of {table_name}: {err}")
+            return None, None
+        # without a record of the last refresh, treat the table as stale
+        refreshed_at = state["refreshed_at"].iloc[0] if len(state) > 0 else datetime.datetime.min
+        return data, refreshed_at
 
 
 class Database:
     """
     Simple interface for an SQLAlchemy connection. Arbitrary queries can be run using
     run_query for testing purposes, but when used in production, additional methods should
-    be written to run those queries in a rigid and safe manner.
+    be written to run those queries in a rigid and safe manner. Reads should go through
+    fetch, or stream for results too large to hold in memory at once, with values passed
+    as parameters.
     """
 
     def __init__(self, endpoint="localhost", port="5432"):
@@ -104,35 +380,309 @@ class Database:
             f"postgresql://{db_user}:{db_pw}@{endpoint}:{port}/{db_name}"
         )
         self.engine = create_engine(self.connection_str)
+        self.table_columns = {}  # cache of table name to its column names
+        self.partitions = set()  # history partitions known to exist
 
     def create_all_tables(self):
-        return self.run_query(CREATE_TABLES_QUERY, expect_results=False)
+        return self.run_query(
+            CREATE_TABLES_QUERY + CREATE_HISTORY_TABLES_QUERY, expect_results=False
+        )
 
     def drop_all_tables(self):
         return self.run_query(DROP_TABLES_QUERY, expect_results=False)
 
-    def update_table_from_df(self, df, table_name):
+    def update_table_from_df(
+        self, df, table_name, payload_hash=None, removed_keys=None, full_sync=False
+    ):
+        """
+        Bulk loads a DataFrame into a table while keeping the declared schema of the table.
+        The rows are streamed in with COPY FROM STDIN. Tables with a natural key in TABLE_KEYS
+        are loaded into a staging table first and then upserted on that key, while all other
+        tables have their contents replaced. For tables in HISTORY_TABLES, the rows are also
+        appended to the history table. The table is marked as refreshed in the same transaction.
+
+        :param df: dataframe with columns named as in the table, extra columns are ignored
+        :param table_name: the name of the table to update
+        :param payload_hash: hash of the API response the data came from
+        :param removed_keys: dataframe of natural keys of rows to delete from the table
+        :param full_sync: whether df holds the whole feed, in which case rows of keyed tables
+            whose keys are not in df are deleted, as they are no longer in the feed
+        :returns: True if the table was updated, False otherwise
+        """
+        keys = TABLE_KEYS.get(table_name)
         try:
-            with self.engine.connect() as conn:
-                df.to_sql(table_name, conn, if_exists="replace", index=False)
+            conn = self.engine.raw_connection()
+            try:
+                with conn.cursor() as cur:
+                    columns = self.get_table_columns(cur, table_name)
+                    df = df[[col for col in df.columns if col in columns]]
+                    self.copy_upsert(cur, df, table_name, keys, full_sync)
+                    if removed_keys is not None:
+                        self.copy_delete(cur, removed_keys, table_name, keys)
+                    created = []
+                    if table_name in HISTORY_TABLES and len(df) > 0:
+                        created = self.copy_history(cur, df, table_name)
+                    cur.execute(
+                        MARK_REFRESHED_QUERY,
+                        {"table_name": table_name, "payload_hash": payload_hash, "changed": True},
+                    )
                 conn.commit()
+                # only once committed, a rolled back partition must be created again
+                self.partitions.update(created)
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                conn.close()
         except Exception as err:
             print(f"Error updating table from DataFrame: {err}")
+            return False
+        return True
+
+    def mark_refreshed(self, table_name, payload_hash):
+        """
+        Marks a table as refreshed without writing any data to it.
+
+        :returns: True if the table was marked, False otherwise
+        """
+        try:
+            conn = self.engine.raw_connection()
+            try:
+                with conn.cursor() as cur:
+                    cur.execute(
+                        MARK_REFRESHED_QUERY,
+                        {"table_name": table_name, "payload_hash": payload_hash, "changed": False},
+                    )
+                conn.commit()
+            finally:
+                conn.close()
+        except Exception as err:
+            print(f"Error marking table as refreshed: {err}")
+            return False
+        return True
+
+    def copy_upsert(self, cur, df, table_name, keys=None, full_sync=False):
+        col_list = ", ".join(df.columns)
+        buffer = self.to_copy_buffer(df)
+
+        if keys is None:
+            cur.execute(f"DELETE FROM {table_name}")
+            cur.copy_expert(
+                f"COPY {table_name} ({col_list}) FROM STDIN WITH (FORMAT csv)", buffer
+            )
+            return
+
+        staging = f"{table_name}_staging"
+        cur.execute(
+            f"CREATE TEMP TABLE {staging} (LIKE {table_name}) ON COMMIT DROP"
+        )
+        cur.copy_expert(
+            f"COPY {staging} ({col_list}) FROM STDIN WITH (FORMAT csv)", buffer
+        )
+        key_list = ", ".join(keys)
+        updates = ", ".join(
+            f"{col} = EXCLUDED.{col}" for col in df.columns if col not in keys
+        )
+        # a frame of nothing but keys, e.g. from an empty feed, has nothing to update
+        conflict = f"DO UPDATE SET {updates}" if updates else "DO NOTHING"
+        # DISTINCT ON since the upsert fails if the same key appears twice
+        cur.execute(
+            f"""
+            INSERT INTO {table_name} ({col_list})
+            SELECT DISTINCT ON ({key_list}) {col_list} FROM {staging}
+            ON CONFLICT ({key_list}) {conflict}
+            """
+        )
+        if full_sync:
+            # rows which are no longer in the feed, e.g. roadworks which have ended
+            matches = " AND ".join(f"t.{key} = s.{key}" for key in keys)
+            cur.execute(
+                f"""
+                DELETE FROM {table_name} t
+                WHERE NOT EXISTS (SELECT 1 FROM {staging} s WHERE {matches})
+                """
+            )
+
+    def copy_delete(self, cur, key_df, table_name, keys):
+        buffer = self.to_copy_buffer(key_df[keys])
+
+        staging = f"{table_name}_removed"
+        key_list = ", ".join(keys)
+        cur.execute(
+            f"""
+            CREATE TEMP TABLE {staging} ON COMMIT DROP
+            AS SELECT {key_list} FROM {table_name} WITH NO DATA
+            """
+        )
+        cur.copy_expert(f"COPY {staging} FROM STDIN WITH (FORMAT csv)", buffer)
+        matches = " AND ".join(f"{table_name}.{key} = {staging}.{key}" for key in keys)
+        cur.execute(f"DELETE FROM {table_name} USING {staging} WHERE {matches}")
+
+    def copy_history(self, cur, df, table_name):
+        """
+        Appends rows to the history table of a table, creating any daily partitions they need.
+
+        :returns: list of names of the partitions created, to be added to self.partitions once
+            the transaction is committed
+        """
+        history_name = f"{table_name}_history"
+        columns = self.get_table_columns(cur, history_name)
+        df = df[[col for col in df.columns if col in columns]]
+
+        # the partitions must exist before any row can be routed to them
+        created = []
+        for day in pd.to_datetime(df["timestamp"]).dt.date.unique():
+            name = partition_name(table_name, day)
+            if name not in self.partitions:
+                cur.execute(
+                    CREATE_PARTITION_QUERY.format(
+                        partition_name=name,
+                        table_name=table_name,
+                        start=day,
+                        end=day + datetime.timedelta(days=1),
+                    )
+                )
+                created.append(name)
+
+        buffer = self.to_copy_buffer(df)
+        cur.copy_expert(
+            f"COPY {history_name} ({', '.join(df.columns)}) FROM STDIN WITH (FORMAT csv)",
+            buffer,
+        )
+        return created
+
+    def to_copy_buffer(self, df):
+        """
+        Writes a dataframe as CSV for COPY FROM STDIN. List values are written as array literals,
+        e.g. ["PIE", "AYE"] becomes {"PIE","AYE"}.
+        """
+        list_columns = [
+            col
+            for col in df.columns
+            if df[col].dtype == object and df[col].map(lambda value: isinstance(value, list)).any()
+        ]
+        if list_columns:
+            df = df.copy()
+            for col in list_columns:
+                df[col] = df[col].map(to_array_literal)
 
-    def run_query(self, query, expect_results=True):
-        print(f"Running query: {query[:100]}")
+        buffer = io.StringIO()
+        df.to_csv(buffer, index=False, header=False)
+        buffer.seek(0)
+        return buffer
+
+    def drop_expired_history(self, retention_days=HISTORY_RETENTION_DAYS):
+        """
+        Drops whole daily partitions of the history tables once every row in them is older
+        than the retention period, which is much cheaper than deleting the rows.
+
+        :param retention_days: number of days of history to keep
+        :returns: list of names of dropped partitions
+        """
+        cutoff = datetime.date.today() - datetime.timedelta(days=retention_days)
+        dropped = []
+        try:
+            conn = self.engine.raw_connection()
+            try:
+                with conn.cursor() as cur:
+                    for table_name in HISTORY_TABLES:
+                        cur.execute(LIST_PARTITIONS_QUERY, (f"{table_name}_history",))
+                        for (name,) in cur.fetchall():
+                            day = datetime.datetime.strptime(name[-8:], "%Y%m%d").date()
+                            if day < cutoff:
+                                cur.execute(f"DROP TABLE {name}")
+                                self.partitions.discard(name)
+                                dropped.append(name)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                conn.close()
+        except Exception as err:
+            print(f"Error dropping expired history: {err}")
+        if dropped:
+            logger.info(f"Dropped expired history partitions: {dropped}")
+        return dropped
+
+    def get_table_columns(self, cur, table_name):
+        if table_name not in self.table_columns:
+            cur.execute(
+                "SELECT column_name FROM information_schema.columns WHERE table_name = %s",
+                (table_name,),
+            )
+            self.table_columns[table_name] = {row[0] for row in cur.fetchall()}
+        return self.table_columns[table_name]
+
+    def run_query(self, query, expect_results=True, params=None):
+        logger.debug(f"Running query: {query[:100]}")
         try:
             # Connect to the DB
             with self.engine.connect() as conn:
-                res = conn.execute(text(query))
+                res = conn.execute(text(query), params or {})
+                # results must be read before the connection is closed
+                results = res.fetchall() if expect_results else None
                 conn.commit()
             # automatically close connection
         except Exception as err:
             print(f"Error running query: {err}")
             return False
-        if expect_results:
-            results = res.fetchall()
-            return results
+        return results
+
+    def fetch(self, query, params=None, table_name=None):
+        """
+        Runs a parameterized query and returns its results as a dataframe. Parameters are
+        given in the query as :name and bound by the driver, so values never need to be
+        formatted into the SQL.
+
+        :param query: SQL query, with parameters as :name
+        :param params: dict of parameter names to values, lists are bound as arrays
+        :param table_name: if given, columns of that table are converted to the same compact
+            dtypes as freshly ingested data
+        :returns: dataframe with one column per result column, even if there are no rows
+        :raises: any error from the database
+        """
+        with self.engine.connect() as conn:
+            res = conn.execute(text(query), params or {})
+            df = pd.DataFrame(res.fetchall(), columns=list(res.keys()))
+        return apply_schema_dtypes(df, table_name) if table_name else df
+
+    def stream(self, query, params=None, table_name=None, batch_size=10000):
+        """
+        Like fetch, but reads the results through a server-side cursor and yields them in
+        dataframes of at most batch_size rows, so memory use stays bounded however large
+        the results are. The connection is held until the generator is exhausted or closed.
+
+        Categorical columns get their categories per batch, so they become plain strings
+        if the batches are concatenated.
+
+        :returns: generator of dataframes
+        :raises: any error from the database
+        """
+        with self.engine.connect() as conn:
+            conn = conn.execution_options(stream_results=True, max_row_buffer=batch_size)
+            res = conn.execute(text(query), params or {})
+            columns = list(res.keys())
+            for rows in res.partitions(batch_size):
+                df = pd.DataFrame(rows, columns=columns)
+                yield apply_schema_dtypes(df, table_name) if table_name else df
+
+    def execute_many(self, query, rows):
+        """
+        Runs a parameterized statement once for each set of parameters, in one round trip
+        for inserts and in one transaction in any case.
+
+        :param query: SQL statement, with parameters as :name
+        :param rows: list of dicts of parameter names to values, e.g. from
+            df.to_dict("records")
+        :returns: number of rows affected
+        :raises: any error from the database
+        """
+        if len(rows) == 0:
+            return 0
+        with self.engine.begin() as conn:
+            res = conn.execute(text(query), rows)
+        return res.rowcount
 
     # def update_tables_from_s3(self, s3_instance):
     #     # Pass in S3 instance when using this
@@ -150,6 +700,90 @@ class Database:
     #         print(f"Error updating table from S3: {err}")
 
 
+class AsyncDatabase:
+    """
+    Async counterpart of Database for the read paths, backed by asyncpg, so that queries can
+    be awaited from the bot's event loop without stalling every other user. Connections come
+    from a pool that is checked with a ping before use, so connections dropped by the
+    database, e.g. after a restart or failover, are replaced instead of failing a query.
+    asyncpg prepares every statement once per connection and caches it, so the parameterized
+    queries run on every user query are only planned once.
+
+    The pool belongs to the event loop it is first used from, and should be closed with
+    dispose before that loop stops.
+    """
+
+    def __init__(self, endpoint="localhost", port="5432", pool_size=10, max_overflow=10):
+        if endpoint is None or port is None:
+            raise Exception("Endpoint or port cannot be empty!")
+
+        db_user, db_pw, db_name = (
+            config["DB_USER"],
+            config["DB_PASSWORD"],
+            config["DB_NAME"],
+        )
+        self.connection_str = (
+            f"postgresql+asyncpg://{db_user}:{db_pw}@{endpoint}:{port}/{db_name}"
+        )
+        self.engine = create_async_engine(
+            self.connection_str,
+            pool_size=pool_size,
+            max_overflow=max_overflow,
+            pool_pre_ping=True,
+            # recycle connections before any idle timeout on the database side
+            pool_recycle=1800,
+            pool_timeout=10,
+            connect_args={
+                "prepared_statement_cache_size": 256,
+                "command_timeout": 30,
+            },
+        )
+
+    async def fetch(self, query, params=None, table_name=None):
+        """
+        Runs a parameterized query and returns its results as a dataframe, see Database.fetch.
+        """
+        async with self.engine.connect() as conn:
+            res = await conn.execute(text(query), params or {})
+            df = pd.DataFrame(res.fetchall(), columns=list(res.keys()))
+        return apply_schema_dtypes(df, table_name) if table_name else df
+
+    async def stream(self, query, params=None, table_name=None, batch_size=10000):
+        """
+        Reads the results of a query through a server-side cursor in dataframes of at most
+        batch_size rows, see Database.stream.
+
+        :returns: async generator of dataframes
+        """
+        async with self.engine.connect() as conn:
+            res = await conn.stream(text(query), params or {})
+            columns = list(res.keys())
+            async for rows in res.partitions(batch_size):
+                df = pd.DataFrame(rows, columns=columns)
+                yield apply_schema_dtypes(df, table_name) if table_name else df
+
+    async def execute_many(self, query, rows):
+        """
+        Runs a parameterized statement once for each set of parameters in one transaction,
+        see Database.execute_many.
+        """
+        if len(rows) == 0:
+            return 0
+        async with self.engine.begin() as conn:
+            res = await conn.execute(text(query), rows)
+        return res.rowcount
+
+    async def dispose(self):
+        await self.engine.dispose()
+
+
+def to_array_literal(values):
+    if not isinstance(values, list):
+        return values
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"') for value in values)
+    return "{" + ",".join(f'"{value}"' for value in escaped) + "}"
+
+
 # Create a DataManager singleton - this should be used from everywhere using the helper function below
 DM_SINGLETON = DataManager()
 
@@ -0,0 +1,86 @@
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# (connect, read) timeouts in seconds for every request which does not set its own
+DEFAULT_TIMEOUT = (5, 30)
+# maximum number of requests being sent to a single host at once, unless overridden in
+# HOST_LIMITS. A slot is only held until the response headers arrive, so the bodies of
+# streamed responses (stream=True) which are still being read do not count against it.
+DEFAULT_HOST_LIMIT = 8
+HOST_LIMITS = {
+    "datamall2.mytransport.sg": 4,
+    "www.onemap.gov.sg": 4,
+}
+RETRY_STATUSES = [429, 500, 502, 503, 504]
+
+
+class HttpClient:
+    """
+    Shared HTTP client for every upstream API. All requests go through a single session, so
+    connections are pooled per host and kept alive across calls instead of paying for a new
+    TCP and TLS handshake every time. Requests which fail with a connection error, 429 or 5xx
+    are retried with jittered exponential backoff (honouring Retry-After), and the number of
+    requests being sent to each host at once is capped.
+
+    The cap only applies to starting requests: a streamed response gives its slot back once
+    its headers arrive, not when it is closed. Holding slots until close could deadlock
+    concurrent page walks of the same host, each holding slots for prefetched later pages
+    while waiting on an earlier page that cannot get one. Callers which stream must bound
+    their own open responses, as DatamallInterface does with max_workers. Connections beyond
+    the pool size are still made, but are closed instead of being kept alive.
+
+    Use the http_client helper function below instead of creating new instances.
+    """
+
+    def __init__(self, retries=3, backoff_factor=0.5, timeout=DEFAULT_TIMEOUT):
+        self.timeout = timeout
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            backoff_jitter=backoff_factor,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=None,  # our POSTs are read-only searches, so retry them too
+            raise_on_status=False,  # hand back the last response and let callers check it
+        )
+        adapter = HTTPAdapter(
+            pool_connections=len(HOST_LIMITS) + 4,
+            pool_maxsize=max([DEFAULT_HOST_LIMIT, *HOST_LIMITS.values()]),
+            max_retries=retry,
+        )
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self.host_semaphores = {}
+        self.lock = threading.Lock()
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        # released when session.request returns, i.e. before a streamed body is read
+        with self.host_semaphore(urlsplit(url).hostname):
+            return self.session.request(method, url, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def host_semaphore(self, host):
+        with self.lock:
+            if host not in self.host_semaphores:
+                limit = HOST_LIMITS.get(host, DEFAULT_HOST_LIMIT)
+                self.host_semaphores[host] = threading.BoundedSemaphore(limit)
+            return self.host_semaphores[host]
+
+
+# Create a HttpClient singleton - this should be used from everywhere using the helper function below
+HTTP_SINGLETON = HttpClient()
+
+
+def http_client():
+    return HTTP_SINGLETON
@@ -12,6 +12,7 @@ from langchain.tools import StructuredTool
 # DO NOT REMOVE! May require next time
 # TODO: Merge router into navigation
 from tools.route_finder import get_routes_tool
+from tools.route_pipeline import find_best_routes_tool
 from tools.route_info_retrieval import (
     retrieve_incidents_tool,
     retrieve_parking_lots_tool,
@@ -47,13 +48,15 @@ class LangchainInterface:
                     To discover and evaluate routes from the user's origin to their destination, you can use
                     the following tools:
 
-                    1. Route-finding function for turn-by-turn instructions from one address to another. This tool
-                    provides you with a few different options for routes, both for driving and public transport.
-                    2. Route-evaluating function to get the best routes out of all the different options.
+                    1. Best-route-finding function, which finds the routes from one address to another, both for
+                    driving and public transport, and ranks them. It gives you the best routes and the facts about
+                    every route the ranking is based on, such as travel time, the roads taken, incidents on those
+                    roads and parking at the destination.
+                    2. Route-finding function for turn-by-turn instructions from one address to another, only if
+                    you need more detail about a route than the best-route-finding function gives.
 
-                    Note that you MUST use the route-evaluating function to evaluate the routes, even if there are
-                    less than three routes given. The route-evaluating function gives you explanations of why the
-                    top routes were chosen. Use this explanation inside your reply to the user.
+                    Note that you MUST use the best-route-finding function to find and evaluate the routes. Use the
+                    facts it gives about the top routes to explain why they were chosen in your reply to the user.
                     DO NOT give the turn-by-turn navigation directions to the user. Instead, you may give
                     a high-level overview of the route, describing it like a person familiar with the roads in Singapore.
                     State whether the route is based on public or private transport.
@@ -76,8 +79,9 @@ class LangchainInterface:
         )
 
         # Combine all tools into a list
-        route_eval_tool = self.get_route_eval_subllm(debug_mode)
-        all_tools = [get_routes_tool, route_eval_tool]
+        # Routes are evaluated in-process by find_best_routes_tool instead of by the RouteEvaluator
+        # sub-LLM from get_route_eval_subllm, which needed several LLM round trips per question
+        all_tools = [find_best_routes_tool, get_routes_tool]
 
         main_llm = ChatOpenAI(
             model_name="gpt-3.5-turbo-0125",
@@ -157,6 +161,21 @@ class LangchainInterface:
         ]
         return answer, history
 
+    async def aquery_agent(self, user_input, history):
+        """
+        Like query_agent, but awaits the agent so that the caller's event loop is free to serve
+        other users meanwhile. Tools without an async variant are run in worker threads.
+        """
+        answer = (
+            await self.agent_executor.ainvoke({"input": user_input, "chat_history": history})
+        )["output"]
+        logger.info(f"Received output from primary agent: {answer}")
+        history += [
+            HumanMessage(content=user_input, example=False),
+            AIMessage(content=answer, example=False),
+        ]
+        return answer, history
+
 
 class SubLLM:
     def __init__(self, name, subprompt, tools, verbose=False):
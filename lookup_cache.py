@@ -0,0 +1,146 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import dotenv
+
+config = dotenv.dotenv_values(".env")
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "lookups.sqlite3")
+# Singapore postal codes are 6 digits, and identify a single building
+POSTAL_CODE = re.compile(r"^(?:SINGAPORE\s*)?(\d{6})$")
+
+
+def normalize_address(address):
+    """
+    Brings differently written versions of the same address or place name to one cache key,
+    e.g. "  Jurong Point, " and "jurong point" are the same key. Postal codes are keyed
+    exactly, so "Singapore 609731" and "609731" are the same key but never match a name.
+    """
+    address = re.sub(r"\s+", " ", address.upper()).strip(" .,")
+    postal_code = POSTAL_CODE.match(address)
+    if postal_code:
+        return f"postal:{postal_code.group(1)}"
+    return "name:" + re.sub(r"\s*,\s*", ", ", address)
+
+
+class LookupCache:
+    """
+    Cache of the results of slow lookups such as geocoding, with an expiry time on every
+    entry and least recently used eviction once it holds max_entries. Entries are kept in a
+    local SQLite file so that they survive restarts, with the most recently used ones also
+    kept in memory, so that repeat lookups neither touch the disk nor the network.
+
+    Each cache is one table in the file, so several caches can share a file. Values must be
+    serializable to JSON.
+    """
+
+    def __init__(self, name, ttl, max_entries=10000, memory_entries=1000, path=None):
+        """
+        :param name: name of the cache, used as the table name
+        :param ttl: seconds an entry stays valid for
+        :param max_entries: number of entries kept in the file
+        :param memory_entries: number of entries also kept in memory
+        :param path: path of the SQLite file, defaults to LOOKUP_CACHE_PATH in .env
+        """
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self.path = path or config.get("LOOKUP_CACHE_PATH") or DEFAULT_CACHE_PATH
+        self.memory = OrderedDict()  # key to (value, expires_at), least recently used first
+        self.lock = threading.Lock()
+        self.conn = None
+
+    def connect(self):
+        # the file is only opened on first use, so that importing a cache is free
+        if self.conn is None:
+            if self.path != ":memory:":
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self.conn = sqlite3.connect(self.path, check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                f"""
+                CREATE TABLE IF NOT EXISTS {self.name} (
+                    key TEXT PRIMARY KEY,
+                    value TEXT,
+                    expires_at REAL,
+                    last_used REAL
+                )
+                """
+            )
+            self.conn.execute(
+                f"CREATE INDEX IF NOT EXISTS {self.name}_last_used_idx ON {self.name} (last_used)"
+            )
+            self.conn.commit()
+        return self.conn
+
+    def get(self, key):
+        """
+        :returns: the cached value, or None if there is none or it expired
+        """
+        now = time.time()
+        with self.lock:
+            if key in self.memory:
+                value, expires_at = self.memory[key]
+                if expires_at > now:
+                    self.memory.move_to_end(key)
+                    return value
+                del self.memory[key]
+
+            conn = self.connect()
+            row = conn.execute(
+                f"SELECT value, expires_at FROM {self.name} WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                conn.execute(f"DELETE FROM {self.name} WHERE key = ?", (key,))
+                conn.commit()
+                return None
+            conn.execute(f"UPDATE {self.name} SET last_used = ? WHERE key = ?", (now, key))
+            conn.commit()
+            value = json.loads(row[0])
+            self.remember(key, value, row[1])
+            return value
+
+    def put(self, key, value):
+        now = time.time()
+        expires_at = now + self.ttl
+        with self.lock:
+            self.remember(key, value, expires_at)
+            conn = self.connect()
+            conn.execute(
+                f"INSERT OR REPLACE INTO {self.name} VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), expires_at, now),
+            )
+            conn.execute(
+                f"""
+                DELETE FROM {self.name} WHERE key IN (
+                    SELECT key FROM {self.name} ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.max_entries,),
+            )
+            conn.commit()
+
+    def get_or_fetch(self, key, fetch):
+        """
+        :param fetch: function computing the value on a miss, which is then cached
+        :returns: the cached value, or the fetched one on a miss
+        """
+        value = self.get(key)
+        if value is None:
+            value = fetch()
+            self.put(key, value)
+        return value
+
+    def remember(self, key, value, expires_at):
+        self.memory[key] = (value, expires_at)
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_entries:
+            self.memory.popitem(last=False)
@@ -0,0 +1,106 @@
+import asyncio
+import random
+from functools import partial
+
+from data_manager import data_manager
+from custom_logger import logger
+
+
+# Refresh cadence of each API in seconds. The keys here are the table names in the database.
+REFRESH_INTERVALS = {
+    "carpark": 60,
+    "trafficincidents": 120,
+    "trafficspeedbands": 300,
+    "esttraveltimes": 300,
+    "faultytrafficlights": 300,
+    "vms": 300,
+    "trafficimages": 300,
+    "airtemp": 300,
+    "rainfall": 300,
+    "weatherforecast": 1800,
+    "psi": 3600,
+    "roadworks": 3600,
+    "roadopenings": 3600,
+    "erprates": 86400,
+}
+# Cadence of maintenance jobs in seconds
+MAINTENANCE_INTERVALS = {
+    "history_retention": 3600,
+}
+
+
+class IngestionScheduler:
+    """
+    Long-running asyncio scheduler which keeps every table fresh on its own cadence,
+    instead of refreshing all APIs at once. Each API gets its own loop which sleeps for
+    its interval (plus or minus some jitter so that APIs sharing an interval drift apart).
+    Maintenance jobs, such as dropping expired history, run on their own loops in the same way.
+    At most max_concurrent APIs are refreshed at the same time, and a run is skipped
+    if the previous run of the same API is still in flight.
+
+    The refreshes themselves are blocking, so they run in worker threads to keep the
+    event loop (which may be shared with the Telegram bot) responsive.
+    """
+
+    def __init__(self, intervals=REFRESH_INTERVALS, max_concurrent=3, jitter=0.1):
+        # job name to (interval, blocking function to run)
+        self.jobs = {
+            api_name: (interval, partial(data_manager().update_table, api_name))
+            for api_name, interval in intervals.items()
+        }
+        self.jobs["history_retention"] = (
+            MAINTENANCE_INTERVALS["history_retention"],
+            data_manager().database.drop_expired_history,
+        )
+        self.jitter = jitter
+        self.semaphore = asyncio.Semaphore(max_concurrent)
+        self.in_flight = {}  # job name to its running task
+        self.tasks = []
+
+    def start(self):
+        """
+        Schedules one loop per job on the running event loop and returns immediately.
+        """
+        # tables are upserted into, so they have to exist before the first refresh
+        data_manager().database.create_all_tables()
+        self.tasks = [
+            asyncio.create_task(self.job_loop(job_name, interval, func))
+            for job_name, (interval, func) in self.jobs.items()
+        ]
+        logger.info(f"Ingestion scheduler started with {len(self.tasks)} jobs")
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+        logger.info("Ingestion scheduler stopped")
+
+    async def run_forever(self):
+        self.start()
+        await asyncio.gather(*self.tasks)
+
+    async def job_loop(self, job_name, interval, func):
+        # spread out the first runs so that we do not hit every API at startup
+        await asyncio.sleep(random.uniform(0, self.jitter * interval))
+        while True:
+            if job_name in self.in_flight:
+                logger.warning(f"Skipping run of {job_name}, previous run still in flight")
+            else:
+                # do not wait for the run, so slow runs do not shift the schedule
+                self.in_flight[job_name] = asyncio.create_task(self.run_job(job_name, func))
+            await asyncio.sleep(interval * random.uniform(1 - self.jitter, 1 + self.jitter))
+
+    async def run_job(self, job_name, func):
+        try:
+            async with self.semaphore:
+                await asyncio.to_thread(func)
+            logger.info(f"Finished running {job_name}")
+        except Exception as err:
+            logger.error(f"Error running {job_name}: {err}")
+        finally:
+            self.in_flight.pop(job_name, None)
+
+
+if __name__ == "__main__":
+    asyncio.run(IngestionScheduler().run_forever())
@@ -0,0 +1,100 @@
+import threading
+import time
+from collections import OrderedDict
+
+from lookup_cache import normalize_address
+
+# Traffic changes quickly, so driving routes are only reused for a few minutes, while transit
+# routes follow timetables and can be reused for longer. Modes not listed here use DEFAULT_TTL.
+MODE_TTLS = {
+    "driving": 5 * 60,
+    "transit": 30 * 60,
+}
+DEFAULT_TTL = 60 * 60
+# departures within the same bucket share cached routes
+BUCKET_SECONDS = 15 * 60
+
+
+class DirectionsCache:
+    """
+    In-memory cache of decoded Directions API responses, so that the same trip asked for
+    again shortly after, e.g. the same commute by several users at peak hour, is answered
+    without another round trip or API call. Responses are keyed by the normalized origin and
+    destination, travel mode, things to avoid and departure time bucket, and expire after the
+    TTL of their mode. The least recently used entries are evicted beyond max_entries.
+
+    Hits, misses and the age of the responses served from the cache are counted, see metrics.
+    """
+
+    def __init__(self, max_entries=2000, bucket_seconds=BUCKET_SECONDS):
+        self.max_entries = max_entries
+        self.bucket_seconds = bucket_seconds
+        self.entries = OrderedDict()  # key to (response, stored_at), least recently used first
+        self.lock = threading.Lock()
+        self.reset_metrics()
+
+    def key(self, origin, destination, mode, avoid="", departure_time=None):
+        """
+        :param avoid: "|"-separated things to avoid, as sent to the API
+        :param departure_time: unix time of departure, defaults to now
+        """
+        departure_time = time.time() if departure_time is None else departure_time
+        return (
+            normalize_address(origin),
+            normalize_address(destination),
+            mode,
+            frozenset(thing for thing in avoid.split("|") if thing),
+            int(departure_time // self.bucket_seconds),
+        )
+
+    def get(self, key):
+        """
+        :returns: the cached response, or None if there is none or it expired
+        """
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                response, stored_at = entry
+                age = now - stored_at
+                if age <= MODE_TTLS.get(key[2], DEFAULT_TTL):
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    self.hit_age_total += age
+                    self.hit_age_max = max(self.hit_age_max, age)
+                    return response
+                del self.entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, response):
+        with self.lock:
+            self.entries[key] = (response, time.time())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def metrics(self, reset=False):
+        """
+        :param reset: start counting afresh after reading the metrics
+        :returns: dict of hits, misses, hit_rate, mean and max age in seconds of the responses
+            served from the cache, and the number of entries
+        """
+        with self.lock:
+            lookups = self.hits + self.misses
+            metrics = {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups > 0 else 0.0,
+                "mean_hit_age_s": self.hit_age_total / self.hits if self.hits > 0 else 0.0,
+                "max_hit_age_s": self.hit_age_max,
+                "entries": len(self.entries),
+            }
+            if reset:
+                self.reset_metrics()
+        return metrics
+
+    def reset_metrics(self):
+        self.hits, self.misses = 0, 0
+        # total and max age in seconds of the responses served from the cache
+        self.hit_age_total, self.hit_age_max = 0.0, 0.0
@@ -0,0 +1,152 @@
+import dataclasses
+import html
+import re
+
+from utils.road_names import normalize_road_name
+
+# tags which start a new line of text in html_instructions, e.g.
+# "Turn <b>left</b> onto <b>PIE</b><div style="font-size:0.9em">Toll road</div>"
+_BLOCK_TAG = re.compile(r"<(?:div|br|p)\b[^>]*>", re.IGNORECASE)
+_TAG = re.compile(r"<[^>]*>")
+_BOLD = re.compile(r"<b>(.*?)</b>", re.IGNORECASE | re.DOTALL)
+_SPACES = re.compile(r"\s+")
+# words in bold in instructions which are directions rather than roads
+DIRECTION_WORDS = {
+    "LEFT",
+    "RIGHT",
+    "SLIGHT LEFT",
+    "SLIGHT RIGHT",
+    "SHARP LEFT",
+    "SHARP RIGHT",
+    "NORTH",
+    "SOUTH",
+    "EAST",
+    "WEST",
+    "NORTHEAST",
+    "NORTHWEST",
+    "SOUTHEAST",
+    "SOUTHWEST",
+}
+
+
+def html_to_text(instructions):
+    """
+    Converts the html_instructions of a step to plain text, with block elements separated
+    by a space instead of running into the text before them.
+    """
+    text = _TAG.sub("", _BLOCK_TAG.sub(" ", instructions))
+    return _SPACES.sub(" ", html.unescape(text)).strip()
+
+
+@dataclasses.dataclass(slots=True)
+class Step:
+    text: str  # instructions as plain text
+    names: list[str]  # names in bold in the instructions, i.e. roads, directions and stops
+    distance_m: int
+    duration_s: int
+    travel_mode: str
+    polyline: str  # encoded polyline of the step
+
+
+@dataclasses.dataclass(slots=True)
+class Route:
+    mode: str
+    summary: str
+    duration_s: int
+    distance_m: int
+    duration_text: str
+    distance_text: str
+    roads: list[str]  # normalized names of the roads along the route, in order
+    polyline: str  # encoded overview polyline of the whole route
+    end_location: tuple[float, float] | None  # (lat, lon) of the end of the route
+    steps: list[Step]
+
+
+def parse_directions(data, mode=""):
+    """
+    Reads the routes out of a decoded Directions API response in a single pass. Only the
+    first leg of each route is read, since we never ask for waypoints.
+
+    :param data: decoded Directions API response
+    :param mode: travel mode the routes were requested for
+    :returns: list of Route
+    """
+    routes = []
+    for route in data.get("routes", []):
+        leg = route["legs"][0]
+        steps = [parse_step(step) for step in leg["steps"]]
+        summary = route.get("summary", "")
+        end_location = leg.get("end_location")
+        routes.append(
+            Route(
+                mode=mode,
+                summary=summary,
+                duration_s=leg["duration"]["value"],
+                distance_m=leg["distance"]["value"],
+                duration_text=leg["duration"]["text"],
+                distance_text=leg["distance"]["text"],
+                roads=route_roads(summary, steps),
+                polyline=route.get("overview_polyline", {}).get("points", ""),
+                end_location=(end_location["lat"], end_location["lng"]) if end_location else None,
+                steps=steps,
+            )
+        )
+    return routes
+
+
+def parse_step(step):
+    instructions = step.get("html_instructions", "")
+    return Step(
+        text=html_to_text(instructions),
+        names=[html_to_text(name) for name in _BOLD.findall(instructions)],
+        distance_m=step.get("distance", {}).get("value", 0),
+        duration_s=step.get("duration", {}).get("value", 0),
+        travel_mode=step.get("travel_mode", ""),
+        polyline=step.get("polyline", {}).get("points", ""),
+    )
+
+
+def route_roads(summary, steps):
+    """
+    :returns: list of the normalized names of the roads a route goes along, in order
+    """
+    roads = [normalize_road_name(summary)] if summary else []
+    for step in steps:
+        for name in step.names:
+            if name.upper() not in DIRECTION_WORDS:
+                roads.append(normalize_road_name(name))
+    return [road for road in dict.fromkeys(roads) if road]
+
+
+def render_routes(routes):
+    """
+    :param routes: list of Route
+    :returns: the routes as the turn-by-turn text the agent reads
+    """
+    if len(routes) == 0:
+        return "Exact address not found, please try again."
+
+    lines = [f"There are {len(routes)} options to go there:"]
+    for k, route in enumerate(routes):
+        lines.append(f"Option {k+1} takes {route.duration_text} and is {route.distance_text} long!")
+        lines.extend(step.text for step in route.steps)
+        lines.append("\n")
+    return "\n".join(lines) + "\n"
+
+
+def render_route_summaries(routes):
+    """
+    :param routes: list of Route
+    :returns: one line per route with its time, distance and roads, which is all the agent
+        needs to describe a route, at a fraction of the size of the turn-by-turn text
+    """
+    if len(routes) == 0:
+        return "Exact address not found, please try again."
+
+    lines = [f"There are {len(routes)} options to go there:"]
+    lines.extend(
+        f"Option {k+1} takes {route.duration_text} and is {route.distance_text} long, "
+        f"along {', '.join(route.roads) or 'unnamed roads'}."
+        for k, route in enumerate(routes)
+    )
+    return "\n".join(lines) + "\n\n"
@@ -1,3 +1,4 @@
+import numpy as np
 from langchain.tools import StructuredTool
 
 
@@ -62,6 +63,88 @@ def evaluate_route(
     return route_score
 
 
+def evaluate_routes(
+    time_taken: np.ndarray,
+    roadworks: np.ndarray,
+    incidents: np.ndarray,
+    breakdowns: np.ndarray,
+    carpark_lots: np.ndarray,
+    is_private: np.ndarray,
+) -> np.ndarray:
+    """
+    Scores many routes at once with the same formula as evaluate_route, giving exactly the
+    same scores. Each argument holds one value per route.
+
+    :param time_taken: travel time of each route, in the same unit as for evaluate_route
+    :param roadworks: number of roadworks on the roads of each route
+    :param incidents: number of incidents on the roads of each route
+    :param breakdowns: number of breakdowns on the roads of each route
+    :param carpark_lots: total available lots of the car parks at the destination of each
+        route, or NaN where there is no car park information
+    :param is_private: whether each route is by private transport
+    :return: array of the score of each route
+    """
+    MAX_SCORE = 100
+    MAX_TIME = 120
+    MAX_CARPARK_LOTS = 100
+    PENALTY_ROADWORK = 10
+    PENALTY_INCIDENT = 20
+
+    time_taken = np.asarray(time_taken, dtype=np.float64)
+    carpark_lots = np.asarray(carpark_lots, dtype=np.float64)
+    is_private = np.asarray(is_private, dtype=bool)
+
+    time_score = np.where(
+        time_taken >= MAX_TIME, 0.0, MAX_SCORE * (1 - (time_taken / MAX_TIME))
+    )
+
+    # counts are integers, so one subtraction of the totals equals one per road
+    penalties = (
+        np.asarray(roadworks, dtype=np.int64) * PENALTY_ROADWORK
+        + np.asarray(incidents, dtype=np.int64) * PENALTY_INCIDENT
+        + np.asarray(breakdowns, dtype=np.int64) * PENALTY_INCIDENT
+    )
+    incident_score = np.maximum(0, MAX_SCORE - penalties)
+
+    has_carparks = is_private & ~np.isnan(carpark_lots)
+    carpark_score = np.where(
+        has_carparks,
+        np.where(
+            carpark_lots >= MAX_CARPARK_LOTS,
+            MAX_SCORE,
+            carpark_lots / MAX_CARPARK_LOTS * MAX_SCORE,
+        ),
+        0,
+    )
+
+    private_score = 0.6 * time_score + 0.3 * incident_score + 0.1 * carpark_score
+    public_score = 0.7 * time_score + 0.3 * incident_score
+    return np.where(is_private, private_score, public_score)
+
+
+def top_k_routes(scores: np.ndarray, k: int, mask: np.ndarray = None) -> np.ndarray:
+    """
+    Picks the k best scoring routes without sorting all of them. Routes with equal scores
+    keep their original order, like a stable sort by descending score.
+
+    :param scores: array of the score of each route
+    :param k: number of routes to pick
+    :param mask: if given, only routes where the mask is True are picked from
+    :return: array of the indices of the picked routes, best first
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    candidates = np.arange(len(scores)) if mask is None else np.flatnonzero(mask)
+    if k <= 0 or len(candidates) == 0:
+        return np.empty(0, dtype=np.int64)
+    if k < len(candidates):
+        # the kth best score, then every route above it and the earliest ones equal to it
+        threshold = np.partition(scores[candidates], len(candidates) - k)[len(candidates) - k]
+        above = candidates[scores[candidates] > threshold]
+        equal = candidates[scores[candidates] == threshold][: k - len(above)]
+        candidates = np.concatenate([above, equal])
+    return candidates[np.lexsort((candidates, -scores[candidates]))]
+
+
 def get_top_public_transport_routes(
     routes_with_score: list[float], is_public_transport: list[bool]
 ) -> str:
@@ -113,38 +196,23 @@ def get_top_transport_routes(
     :param is_public_transport: List of booleans, indicating whether each route is a public transport route.
     :return: A formatted string describing the top transport routes.
     """
-    # Combine each route score with its index and separate public and private routes
-    transport_routes_with_scores = [
-        (index + 1, score, is_public)
-        for index, (score, is_public) in enumerate(
-            zip(routes_with_score, is_public_transport)
-        )
-    ]
-
-    # Sort the transport routes by score in descending order
-    sorted_transport_routes = sorted(
-        transport_routes_with_scores, key=lambda x: x[1], reverse=True
-    )
-
-    # Split the sorted routes into public and private
-    private_routes = [route for route in sorted_transport_routes if not route[2]]
-    public_routes = [route for route in sorted_transport_routes if route[2]]
+    scores = np.asarray(routes_with_score, dtype=np.float64)
+    is_public = np.asarray(is_public_transport, dtype=bool)
 
     # Create the formatted output
     top_route_strings = []
 
     # Get top 2 private routes
-    for i, (route_index, score, _) in enumerate(private_routes[:2]):
+    for i, index in enumerate(top_k_routes(scores, 2, ~is_public)):
         position = "Best" if i == 0 else "Second best"
         top_route_strings.append(
-            f"{position} private route is route {route_index} (score={score:.1f})"
+            f"{position} private route is route {index + 1} (score={scores[index]:.1f})"
         )
 
     # Get top 1 public route if available
-    if public_routes:
-        route_index, score, _ = public_routes[0]
+    for index in top_k_routes(scores, 1, is_public):
         top_route_strings.append(
-            f"Best public route is route {route_index} (score={score:.1f})"
+            f"Best public route is route {index + 1} (score={scores[index]:.1f})"
         )
 
     # Join the route strings with a new line and appropriate heading
@@ -1,19 +1,40 @@
 import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from urllib.parse import urlencode
-import requests
-from bs4 import BeautifulSoup
 import dotenv
 
 from langchain_core.tools import StructuredTool
 
+from http_client import http_client
+from lookup_cache import LookupCache, normalize_address
+from tools.directions_cache import DirectionsCache
+from tools.directions_parser import parse_directions, render_route_summaries, render_routes
 
-config = dotenv.dotenv_values(".env")
 
+config = dotenv.dotenv_values(".env")
 
-def get_routes(origin: str, destination: str):
+# places matching a search text change rarely, but do change as places open and close
+PLACES_CACHE = LookupCache("places", ttl=7 * 24 * 3600)
+# shared by all questions, so that the requests of one question run side by side
+EXECUTOR = ThreadPoolExecutor(max_workers=8)
+DIRECTIONS_CACHE = DirectionsCache()
+# travel modes of the Directions API, and how the routes of each mode are introduced
+MODE_PREFIXES = {
+    "driving": "By private transport, ",
+    "transit": "By public transport, ",
+    "walking": "On foot, ",
+    "bicycling": "By bicycle, ",
+}
+DEFAULT_MODES = "driving, transit"
+
+
+def get_routes(
+    origin: str, destination: str, modes: str = DEFAULT_MODES, turn_by_turn: bool = True
+):
     # TODO: Use "avoid" parameter
     nav = Navigation(origin, destination, config["GOOGLE_API_KEY"])
-    return nav.driving() + nav.publictransport()
+    renderer = render_routes if turn_by_turn else render_route_summaries
+    return nav.routes([mode.strip() for mode in modes.split(",")], renderer)
 
 get_routes_tool = StructuredTool.from_function(
     func=get_routes,
@@ -27,6 +48,9 @@ get_routes_tool = StructuredTool.from_function(
     These should be noted for later use in other tools.
 
     Some portions of the directions may include road and expressway names, which should be noted and used.
+
+    Other travel modes can be asked for as a comma-separated list, e.g. "driving, transit, walking, bicycling".
+    With turn_by_turn set to false, each option is given in one line with the roads it goes along instead.
     """
 )
 
@@ -72,22 +96,43 @@ class Navigation:
         self.validate_address()
 
     def validate_address(self):
-        verified_origin = self.text_query(self.origin)
-        verified_destination = self.text_query(self.destination)
+        # look up both places at the same time instead of one after the other
+        origin_lookup = EXECUTOR.submit(self.cached_text_query, self.origin)
+        verified_destination = self.cached_text_query(self.destination)
+        verified_origin = origin_lookup.result()
+
+        if len(verified_origin) == 0:
+            print("There is no place matching your original location")
 
-        if len(verified_origin) > 1:
+        elif len(verified_origin) > 1:
             print("There are more than 1 place matching your original location")
             print(location for location in verified_origin)
 
         else:
             self.origin = verified_origin[0]
 
-        if len(verified_destination) > 1:
+        if len(verified_destination) == 0:
+            print("There is no place matching your destination location")
+
+        elif len(verified_destination) > 1:
             print("There are more than 1 place matching your destination location")
             print(location for location in verified_destination)
         else:
             self.destination = verified_destination[0]
 
+    def cached_text_query(self, query):
+        """
+        Like text_query, but the formatted addresses found for a query are cached by its
+        normalized text, see PLACES_CACHE. Queries without any match are not cached.
+        """
+        key = normalize_address(query)
+        places = PLACES_CACHE.get(key)
+        if places is None:
+            places = self.text_query(query)
+            if len(places) > 0:
+                PLACES_CACHE.put(key, places)
+        return places
+
     def text_query(self, query):
         url = "https://places.googleapis.com/v1/places:searchText"
         params = {"textQuery": query}
@@ -97,72 +142,43 @@ class Navigation:
             "X-Goog-FieldMask": "places.displayName,places.formattedAddress",  # ,places.priceLevel"
         }
 
-        response = requests.post(url, json=params, headers=headers)
+        response = http_client().post(url, json=params, headers=headers)
 
-        return [place["formattedAddress"] for place in response.json()["places"]]
+        # no places key at all when nothing matches
+        return [place["formattedAddress"] for place in response.json().get("places", [])]
 
     def query(self, params):
+        """
+        Calls the Directions API, or answers from DIRECTIONS_CACHE if the same trip was asked
+        for recently. Only successful responses are cached.
+
+        :returns: the decoded response, which must be treated as read-only since it is shared
+        """
+        key = DIRECTIONS_CACHE.key(
+            params["origin"], params["destination"], params["mode"], params["avoid"]
+        )
+        data = DIRECTIONS_CACHE.get(key)
+        if data is not None:
+            return data
+
         query_string = urlencode(params)
 
         # Construct the complete URL
         base_url = "https://maps.googleapis.com/maps/api/directions/json?"
         url = base_url + query_string
-        return requests.request("Get", url)
-
-    def parse_response(self, response):
-        clean_steps = []
-        total_distance = []
-        total_duration = []
-
-        options = len(response.json()["routes"])
-        output_str = ""
-        if options > 0:
-            output_str += f"There are {options} options to go there:\n"
-
-            for k in range(0, options):
-                steps = []
-                for i in range(
-                    0, len(response.json()["routes"][k]["legs"][0]["steps"])
-                ):
-                    steps.append(
-                        response.json()["routes"][k]["legs"][0]["steps"][i][
-                            "html_instructions"
-                        ]
-                    )
-                clean_steps.append(
-                    [
-                        BeautifulSoup(step, "html.parser").get_text().strip()
-                        for step in steps
-                    ]
-                )
-                total_distance.append(
-                    response.json()["routes"][k]["legs"][0]["distance"]["text"]
-                )
-                total_duration.append(
-                    response.json()["routes"][k]["legs"][0]["duration"]["text"]
-                )
-
-            # with open(self.output_file, "a") as file:
-            for k in range(0, options):
-                newline = f"Option {k+1} takes {total_duration[k]} and is {total_distance[k]} long!"
-                # file.writelines([newline, '\n'])
-                output_str += newline + "\n"
-                for line in clean_steps[k]:
-                    # file.writelines(line + '\n')
-                    output_str += line + "\n"
-                # file.writelines(['\n', '\n'])
-                output_str += "\n\n"
-
-            # print('Navigation steps written successfully to', self.output_file)
-
-        else:
-            return "Exact address not found, please try again."
-
-        return output_str
-
-    def driving(self):
-        mode = "driving"
-        params_driving = {
+        data = http_client().get(url).json()
+        if data.get("status") == "OK":
+            DIRECTIONS_CACHE.put(key, data)
+        return data
+
+    def parse_response(self, data):
+        return render_routes(parse_directions(data))
+
+    def route_options(self, mode):
+        """
+        :returns: list of Route, the route options for a travel mode
+        """
+        params = {
             "origin": self.origin,
             "destination": self.destination,
             "alternatives": self.alternatives,
@@ -170,23 +186,57 @@ class Navigation:
             "avoid": self.avoid_str,
             "key": self.google_api_key,
         }
-        # self.write_to_file(self.query(params_driving))
-        return "By private transport, " + self.parse_response(
-            self.query(params_driving)
-        )
+        # self.write_to_file(self.query(params))
+        return parse_directions(self.query(params), mode)
+
+    def directions(self, mode):
+        return MODE_PREFIXES[mode] + render_routes(self.route_options(mode))
+
+    def driving(self):
+        return self.directions("driving")
 
     def publictransport(self):
-        mode = "transit"
-        params_public = {
-            "origin": self.origin,
-            "destination": self.destination,
-            "alternatives": self.alternatives,
-            "mode": mode,
-            "avoid": self.avoid_str,
-            "key": self.google_api_key,
-        }
-        # self.write_to_file(self.query(params_public))
-        return "By public transport, " + self.parse_response(self.query(params_public))
+        return self.directions("transit")
+
+    def route_options_by_mode(self, modes):
+        """
+        Finds the route options for several travel modes at once. The request for each mode
+        is sent at the same time, so asking for more modes barely adds to the wait.
+
+        :param modes: list of travel modes, see MODE_PREFIXES. Unknown modes are ignored, and
+            driving and transit are used if none are left.
+        :returns: dict of each travel mode to its list of route options, in the order of modes,
+            or to None if the request for that mode failed
+        """
+        modes = [mode for mode in dict.fromkeys(modes) if mode in MODE_PREFIXES] or [
+            "driving",
+            "transit",
+        ]
+        lookups = {EXECUTOR.submit(self.route_options, mode): mode for mode in modes}
+        results = {}
+        for lookup in as_completed(lookups):
+            mode = lookups[lookup]
+            try:
+                results[mode] = lookup.result()
+            except Exception as err:
+                print(f"Error finding {mode} routes: {err}")
+                results[mode] = None
+        return {mode: results[mode] for mode in modes}
+
+    def routes(self, modes, renderer=render_routes):
+        """
+        Finds routes for several travel modes at once, see route_options_by_mode. Modes which
+        fail are reported as unavailable instead of failing the others.
+
+        :param renderer: function turning a list of Route into text, e.g. render_route_summaries
+
+        :returns: the routes of every mode in a single string, in the order of modes
+        """
+        return "".join(
+            MODE_PREFIXES[mode]
+            + (renderer(options) if options is not None else "no routes are available right now.\n\n")
+            for mode, options in self.route_options_by_mode(modes).items()
+        )
 
 
 # Here is how to test this function
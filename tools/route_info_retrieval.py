@@ -1,6 +1,5 @@
-import datetime
+import asyncio
 
-import pandas as pd
 from langchain.tools import StructuredTool
 
 from data_manager import data_manager
@@ -11,52 +10,50 @@ def retrieve_incidents(roads_list: str) -> str:
     # somehow the LLM just wants to call this tool in this format...
     roads_list = roads_list.split(", ")
 
-    # run a query against our database to get traffic incidents for this road
-    incidents = data_manager().query(
-        "SELECT * FROM trafficincidents WHERE (NOW() - INTERVAL '1 hour') <= timestamp"
-        # "SELECT * FROM trafficincidents"
-    )
+    # get traffic incidents on these roads reported in the last hour
+    incidents = data_manager().incidents_on_roads(roads_list)
 
-    incidents = incidents[["type", "message"]]
+    return format_incidents(incidents)
 
-    # extract the timestamp and filter to keep only incidents from less than 1 hour ago
-    incidents[["timestamp", "message"]] = incidents["message"].str.split(
-        " ", n=1, expand=True
-    )
-    incidents["timestamp"] = pd.to_datetime(
-        incidents["timestamp"], format="(%d/%m)%H:%M"
-    )  # convert to time type
-    one_hour_ago_today = datetime.datetime.now() - datetime.timedelta(hours=1)
-    filtered_incidents = incidents[incidents["timestamp"] >= one_hour_ago_today]
 
+async def aretrieve_incidents(roads_list: str) -> str:
+    incidents = await data_manager().aincidents_on_roads(roads_list.split(", "))
+    return format_incidents(incidents)
+
+
+def format_incidents(incidents):
     # join it into a single string since LLMs can read
-    filtered_messages = ", ".join(list(filtered_incidents["message"]))
-    return filtered_messages
+    return ", ".join(list(incidents["message"])) if len(incidents) > 0 else ""
 
 
 def retrieve_parking_lots(destination: str) -> str:
-    # Retrieve car park data
-    carpark_df = data_manager().query(
-        "SELECT * FROM carpark WHERE (NOW() - INTERVAL '1 hours') <= timestamp"
-    )
+    # Retrieve the car parks nearest to the destination
     lat, lon = map(float, get_addr_coordinates(destination).split(","))
     # TODO: Think about converting this to use Google Maps instead
+    final_car_parks = data_manager().nearest_carparks(lat, lon, k=3)
+    return format_parking_lots(final_car_parks)
+
+
+async def aretrieve_parking_lots(destination: str) -> str:
+    # geocoding is a blocking HTTP call, so it runs in a worker thread
+    coordinates = await asyncio.to_thread(get_addr_coordinates, destination)
+    lat, lon = map(float, coordinates.split(","))
+    final_car_parks = await data_manager().anearest_carparks(lat, lon, k=3)
+    return format_parking_lots(final_car_parks)
+
 
-    # Calculate distance between destination and car parks [replace by google map API]
-    carpark_df[["lat", "lon"]] = carpark_df["location"].str.split(" ", expand=True)
-    carpark_df["distance"] = (
-        (pd.to_numeric(carpark_df["lat"]) - lat) ** 2
-        + (pd.to_numeric(carpark_df["lon"]) - lon) ** 2
-    ) ** 0.5
+def format_parking_lots(car_parks):
+    if len(car_parks) == 0:
+        return "No car park information available."
 
-    # Keep 3 nearest car parks and return them as a single string
-    final_car_parks = carpark_df.sort_values("distance", ascending=False).iloc[:3]
-    final_report = str(final_car_parks[["development", "availablelots"]])
+    # Return the 3 nearest car parks as a single string
+    final_report = str(car_parks[["development", "availablelots"]])
     return final_report
 
 
 retrieve_incidents_tool = StructuredTool.from_function(
     func=retrieve_incidents,
+    coroutine=aretrieve_incidents,
     name="IncidentRetrieverTool",
     description="""
     Extract and return currently ongoing road incidents on the provided roads as a comma-separated list.
@@ -66,6 +63,7 @@ retrieve_incidents_tool = StructuredTool.from_function(
 
 retrieve_parking_lots_tool = StructuredTool.from_function(
     func=retrieve_parking_lots,
+    coroutine=aretrieve_parking_lots,
     name="ParkingAvailabilityRetrieverTool",
     description="""
     Given a destination, gives the nearest car park and the available parking lots there as a string.
@@ -0,0 +1,238 @@
+import asyncio
+
+import dotenv
+import numpy as np
+import pandas as pd
+
+from langchain_core.tools import StructuredTool
+
+from data_manager import data_manager
+from tools.route_evaluation import evaluate_routes, get_top_transport_routes
+from tools.route_finder import EXECUTOR, MODE_PREFIXES, Navigation
+
+config = dotenv.dotenv_values(".env")
+
+# modes which are evaluated, and whether each one is public transport
+EVALUATED_MODES = {"driving": False, "transit": True}
+# incident types which evaluate_route counts separately, all others count as incidents
+INCIDENT_CATEGORIES = {"Roadwork": "roadworks", "Vehicle breakdown": "breakdowns"}
+CATEGORIES = ["roadworks", "incidents", "breakdowns"]
+NO_ROUTES = "No routes could be found, please check the origin and destination."
+
+
+def find_best_routes(origin: str, destination: str) -> str:
+    """
+    Finds the driving and public transport routes between two places and ranks them, without
+    any LLM in the loop. The routes of both modes are looked up at the same time, then the
+    incidents on every road of every route and the car parks at the destination are looked
+    up at the same time, along with the live traffic on each driving route from the speed
+    bands of the road links it runs on. All routes are scored at once with evaluate_routes,
+    with the delay traffic adds to driving routes counted in their time, and ranked with
+    get_top_transport_routes.
+
+    :returns: the ranking followed by the facts behind it, as text for the agent
+    """
+    routes = find_routes(origin, destination)
+    if len(routes) == 0:
+        return NO_ROUTES
+
+    incidents_lookup = EXECUTOR.submit(data_manager().incidents_on_roads, all_roads(routes))
+    congestion_lookups = [
+        EXECUTOR.submit(route_congestion, mode, route) for mode, route in routes
+    ]
+    carparks = carparks_near(routes)
+    return rank_routes(
+        routes,
+        incidents_lookup.result(),
+        [lookup.result() for lookup in congestion_lookups],
+        carparks,
+    )
+
+
+async def afind_best_routes(origin: str, destination: str) -> str:
+    """
+    Like find_best_routes, but awaits the incident and car park lookups instead of blocking
+    the calling thread. The Google API calls and the matching of routes to road links still
+    run in worker threads.
+    """
+    routes = await asyncio.to_thread(find_routes, origin, destination)
+    if len(routes) == 0:
+        return NO_ROUTES
+
+    incidents, carparks, *congestion_by_route = await asyncio.gather(
+        data_manager().aincidents_on_roads(all_roads(routes)),
+        acarparks_near(routes),
+        *(asyncio.to_thread(route_congestion, mode, route) for mode, route in routes),
+    )
+    return rank_routes(routes, incidents, congestion_by_route, carparks)
+
+
+def find_routes(origin, destination):
+    """
+    :returns: list of tuples of (mode, route) of every route of the evaluated modes
+    """
+    nav = Navigation(origin, destination, config["GOOGLE_API_KEY"])
+    options_by_mode = nav.route_options_by_mode(list(EVALUATED_MODES))
+    return [
+        (mode, route)
+        for mode, options in options_by_mode.items()
+        for route in options or []
+    ]
+
+
+def all_roads(routes):
+    return sorted({road for _, route in routes for road in route.roads})
+
+
+def route_congestion(mode, route):
+    """
+    :returns: RouteCongestion of a route, or None if its live traffic is unknown
+    """
+    # live traffic is only known for the roads, so only routes by private transport get it
+    if EVALUATED_MODES[mode]:
+        return None
+    return data_manager().route_congestion([step.polyline for step in route.steps])
+
+
+def end_location(routes):
+    return next(
+        (route.end_location for _, route in routes if route.end_location is not None),
+        None,
+    )
+
+
+def carparks_near(routes):
+    location = end_location(routes)
+    if location is None:
+        return pd.DataFrame(columns=["development", "availablelots"])
+    return data_manager().nearest_carparks(*location, k=3)
+
+
+async def acarparks_near(routes):
+    location = end_location(routes)
+    if location is None:
+        return pd.DataFrame(columns=["development", "availablelots"])
+    return await data_manager().anearest_carparks(*location, k=3)
+
+
+def rank_routes(routes, incidents, congestion_by_route, carparks):
+    """
+    Scores and ranks routes from what was looked up about them, see find_best_routes.
+
+    :param routes: list of tuples of (mode, route)
+    :param incidents: dataframe of the incidents on the roads of the routes
+    :param congestion_by_route: list of the RouteCongestion of each route, or None
+    :param carparks: dataframe of the car parks nearest to the destination
+    :returns: the ranking followed by the facts behind it, as text for the agent
+    """
+    roads_by_route = [route.roads for _, route in routes]
+    carpark_availability = {
+        carpark["development"]: {
+            "availablelots": 0 if pd.isna(carpark["availablelots"]) else int(carpark["availablelots"])
+        }
+        for _, carpark in carparks.iterrows()
+    }
+
+    incidents_by_route = [road_incidents(roads, incidents) for roads in roads_by_route]
+    totals = np.array(
+        [
+            [sum(road[category] for road in road_information.values()) for category in CATEGORIES]
+            for road_information, _ in incidents_by_route
+        ],
+        dtype=np.int64,
+    ).reshape(len(routes), len(CATEGORIES))
+    is_public_transport = np.array([EVALUATED_MODES[mode] for mode, _ in routes])
+    total_lots = sum(carpark["availablelots"] for carpark in carpark_availability.values())
+    delays_s = np.array(
+        [0.0 if congestion is None else congestion.delay_s for congestion in congestion_by_route]
+    )
+    scores = evaluate_routes(
+        # evaluate_route scales time against a maximum of 120, in minutes, and routes lose
+        # the time they are estimated to be delayed by traffic right now
+        np.array([route.duration_s for _, route in routes]) / 60 + delays_s / 60,
+        totals[:, 0],
+        totals[:, 1],
+        totals[:, 2],
+        # car parks only count for private transport, and only if there are any
+        np.full(len(routes), total_lots if len(carpark_availability) > 0 else np.nan),
+        ~is_public_transport,
+    )
+    facts = [
+        route_facts(index + 1, mode, route, roads, messages, congestion, score)
+        for index, ((mode, route), roads, (_, messages), congestion, score) in enumerate(
+            zip(routes, roads_by_route, incidents_by_route, congestion_by_route, scores)
+        )
+    ]
+
+    ranking = get_top_transport_routes(scores, is_public_transport)
+    parking = ", ".join(
+        f"{development} has {carpark['availablelots']} lots available"
+        for development, carpark in carpark_availability.items()
+    )
+    parking = parking or "no information available"
+    return "\n".join([ranking, "", *facts, "", f"Parking near the destination: {parking}."])
+
+
+def road_incidents(roads, incidents):
+    """
+    :param roads: list of normalized road names of a route
+    :param incidents: dataframe of incidents, with the roads each one is on
+    :returns: tuple of (road_information for evaluate_route, list of the messages of the
+        incidents on the roads)
+    """
+    road_information = {
+        road: {category: 0 for category in CATEGORIES} for road in roads
+    }
+    messages = []
+    for incident_type, message, incident_roads in zip(
+        incidents["type"], incidents["message"], incidents["roads"]
+    ):
+        # roads may be None or a numpy array when loaded back from the database
+        incident_roads = incident_roads if incident_roads is not None else []
+        on_route = [road for road in incident_roads if road in road_information]
+        if len(on_route) == 0:
+            continue
+        category = INCIDENT_CATEGORIES.get(incident_type, "incidents")
+        for road in on_route:
+            road_information[road][category] += 1
+        messages.append(message)
+    # only roads with something on them affect the score, which keeps the facts short
+    return {
+        road: counts for road, counts in road_information.items() if any(counts.values())
+    }, messages
+
+
+def route_facts(route_index, mode, route, roads, messages, congestion, score):
+    via = f" via {route.summary}" if route.summary else ""
+    incidents = " ".join(messages) if messages else "none"
+    return (
+        f"Route {route_index} is {MODE_PREFIXES[mode].strip(', ').lower()}{via}, takes "
+        f"{route.duration_text} and is {route.distance_text} long (score={score:.1f}). "
+        f"Roads: {', '.join(roads) or 'unknown'}. Incidents on these roads: {incidents}"
+        + traffic_facts(congestion)
+    )
+
+
+def traffic_facts(congestion):
+    """
+    :param congestion: RouteCongestion of a route, or None if live traffic is unknown
+    """
+    if congestion is None or np.isnan(congestion.speed_band):
+        return ""
+    return (
+        f" Live traffic: congestion {congestion.score:.0f}/100 (mean speed band "
+        f"{congestion.speed_band:.1f} of 8 over {congestion.matched_fraction:.0%} of the route), "
+        f"about {round(congestion.delay_s / 60)} min of delay."
+    )
+
+
+find_best_routes_tool = StructuredTool.from_function(
+    func=find_best_routes,
+    coroutine=afind_best_routes,
+    name="BestRouteFinderTool",
+    description="""
+    Given an origin and a destination, finds the driving and public transport routes between them and ranks them
+    by travel time, incidents and roadworks on their roads, and parking availability at the destination.
+    Returns the best routes, followed by the facts about every route which the ranking is based on.
+    """,
+)
@@ -1,13 +1,18 @@
-import requests
 import dotenv
 import json
-from bs4 import BeautifulSoup
 from urllib.parse import urlencode
 
 from langchain_core.tools import tool
 
+from http_client import http_client
+from lookup_cache import LookupCache, normalize_address
+from tools.directions_parser import parse_directions
+
 config = dotenv.dotenv_values(".env")
 
+# buildings rarely move, so geocodes are kept for a month
+GEOCODE_CACHE = LookupCache("geocodes", ttl=30 * 24 * 3600)
+
 
 @tool
 def get_route_tool(addr1: str, addr2: str) -> str:
@@ -37,13 +42,25 @@ class Router:
         return directions
 
     def get_addr_coords(self, search):
-        search.replace(" ", "%20")  # encode spaces in query
-        api_search = f"searchVal={search}&returnGeom=Y&getAddrDetails=N"
+        """
+        Geocodes an address, place name or postal code with OneMap. Results are cached by
+        normalized address, see GEOCODE_CACHE.
 
-        response = requests.get(self.onemap_api_url + api_search)
+        :returns: comma-separated lat-lon coordinate string
+        """
+        return GEOCODE_CACHE.get_or_fetch(
+            normalize_address(search), lambda: self.search_addr_coords(search)
+        )
+
+    def search_addr_coords(self, search):
+        api_search = urlencode(
+            {"searchVal": search, "returnGeom": "Y", "getAddrDetails": "N"}
+        )
+
+        response = http_client().get(self.onemap_api_url + api_search)
         results = json.loads(response.text)["results"]
         if len(results) == 0:
-            raise (f"Could not find location: {search}")
+            raise ValueError(f"Could not find location: {search}")
 
         first_result = results[0]
         lat = first_result["LATITUDE"]
@@ -64,18 +81,12 @@ class Router:
 
         # Construct the complete URL
         url = self.gmaps_api_url + query_string
-        response = requests.request("Get", url)
-
-        steps = []
-        for i in range(0, len(response.json()["routes"][0]["legs"][0]["steps"])):
-            steps.append(
-                response.json()["routes"][0]["legs"][0]["steps"][i]["html_instructions"]
-            )
+        response = http_client().get(url)
 
-        clean_steps = [
-            BeautifulSoup(step, "html.parser").get_text().strip() for step in steps
-        ]
+        routes = parse_directions(response.json())
+        if len(routes) == 0:
+            raise ValueError(f"Could not find a route from {start_coords} to {end_coords}")
 
-        step_string = "\n".join(clean_steps)
+        step_string = "\n".join(step.text for step in routes[0].steps)
 
         return step_string
@@ -1,5 +1,5 @@
 CREATE_TABLES_QUERY = """
-            CREATE TABLE carpark(
+            CREATE TABLE IF NOT EXISTS carpark(
                 carparkid TEXT,
                 area TEXT,
                 development TEXT,
@@ -7,10 +7,19 @@ CREATE_TABLES_QUERY = """
                 availablelots INTEGER,
                 lottype TEXT,
                 agency TEXT,
-                timestamp TIMESTAMP
+                timestamp TIMESTAMP,
+                latitude DOUBLE PRECISION,
+                longitude DOUBLE PRECISION,
+                geohash TEXT,
+                PRIMARY KEY (carparkid, lottype)
             );
+            ALTER TABLE carpark ADD COLUMN IF NOT EXISTS latitude DOUBLE PRECISION;
+            ALTER TABLE carpark ADD COLUMN IF NOT EXISTS longitude DOUBLE PRECISION;
+            ALTER TABLE carpark ADD COLUMN IF NOT EXISTS geohash TEXT;
+            CREATE INDEX IF NOT EXISTS carpark_geohash_idx ON carpark (geohash);
+            CREATE INDEX IF NOT EXISTS carpark_geohash5_idx ON carpark (LEFT(geohash, 5));
 
-            CREATE TABLE erprates(
+            CREATE TABLE IF NOT EXISTS erprates(
                 vehicletype TEXT,
                 daytype TEXT,
                 starttime TIME,
@@ -21,17 +30,17 @@ CREATE_TABLES_QUERY = """
                 timestamp TIMESTAMP
             );
 
-            CREATE TABLE esttraveltimes(
+            CREATE TABLE IF NOT EXISTS esttraveltimes(
                 name TEXT,
                 direction INT,
-                farendoint TEXT,
+                farendpoint TEXT,
                 startpoint TEXT,
                 endpoint TEXT,
                 esttime INT,
                 timestamp TIMESTAMP
             );
 
-            CREATE TABLE faultytrafficlights (
+            CREATE TABLE IF NOT EXISTS faultytrafficlights (
                 alarmid TEXT,
                 nodeid INT,
                 type INT,
@@ -41,8 +50,8 @@ CREATE_TABLES_QUERY = """
                 timestamp TIMESTAMP
             );
 
-            CREATE TABLE roadopenings (
-                eventid TEXT,
+            CREATE TABLE IF NOT EXISTS roadopenings (
+                eventid TEXT PRIMARY KEY,
                 startdate TEXT,
                 enddate TEXT,
                 svcdept TEXT,
@@ -50,8 +59,8 @@ CREATE_TABLES_QUERY = """
                 other TEXT,
                 timestamp TIMESTAMP
             );
-            CREATE TABLE roadworks (
-                eventid TEXT,
+            CREATE TABLE IF NOT EXISTS roadworks (
+                eventid TEXT PRIMARY KEY,
                 startdate TEXT,
                 enddate TEXT,
                 svcdept TEXT,
@@ -60,26 +69,34 @@ CREATE_TABLES_QUERY = """
                 timestamp TIMESTAMP
             );
 
-            CREATE TABLE trafficimages (
+            CREATE TABLE IF NOT EXISTS trafficimages (
                 cameraid TEXT,
                 latitude TEXT,
                 longitude TEXT,
                 imagelink TEXT
             );
 
-            CREATE TABLE trafficincidents (
+            CREATE TABLE IF NOT EXISTS trafficincidents (
                 type TEXT,
                 latitude DECIMAL,
                 longitude DECIMAL,
                 message TEXT,
-                timestamp TIMESTAMP
+                timestamp TIMESTAMP,
+                roads TEXT[],
+                reported_at TIMESTAMP
             );
+            ALTER TABLE trafficincidents ADD COLUMN IF NOT EXISTS roads TEXT[];
+            ALTER TABLE trafficincidents ADD COLUMN IF NOT EXISTS reported_at TIMESTAMP;
+            CREATE INDEX IF NOT EXISTS trafficincidents_roads_idx
+            ON trafficincidents USING GIN (roads);
+            CREATE INDEX IF NOT EXISTS trafficincidents_reported_at_idx
+            ON trafficincidents (reported_at);
 
-            CREATE TABLE trafficspeedbands (
-                linkid TEXT,
+            CREATE TABLE IF NOT EXISTS trafficspeedbands (
+                linkid TEXT PRIMARY KEY,
                 roadname TEXT,
                 roadcategory TEXT,
-                speedband TEXT,
+                speedband SMALLINT,
                 minimumspeed INTEGER,
                 maximumspeed INTEGER,
                 startlon DECIMAL,
@@ -89,7 +106,7 @@ CREATE_TABLES_QUERY = """
                 timestamp TIMESTAMP
             );
 
-            CREATE TABLE vms(
+            CREATE TABLE IF NOT EXISTS vms(
                 equipmentid TEXT,
                 latitude DECIMAL,
                 longitude DECIMAL,
@@ -97,7 +114,7 @@ CREATE_TABLES_QUERY = """
                 timestamp TIMESTAMP
             );
 
-            CREATE TABLE airtemp (
+            CREATE TABLE IF NOT EXISTS airtemp (
                 stationid TEXT,
                 temperature DECIMAL,
                 stationname TEXT,
@@ -106,7 +123,7 @@ CREATE_TABLES_QUERY = """
                 timestamp TIMESTAMP
             );
 
-            CREATE TABLE rainfall (
+            CREATE TABLE IF NOT EXISTS rainfall (
                 stationid TEXT,
                 rainfall DECIMAL,
                 stationname TEXT,
@@ -115,7 +132,7 @@ CREATE_TABLES_QUERY = """
                 timestamp TIMESTAMP
             );
 
-            CREATE TABLE psi (
+            CREATE TABLE IF NOT EXISTS psi (
                 region TEXT,
                 area TEXT,
                 psi INTEGER,
@@ -123,12 +140,19 @@ CREATE_TABLES_QUERY = """
                 timestamp TIMESTAMP
             );
 
-            CREATE TABLE weatherforecast (
+            CREATE TABLE IF NOT EXISTS weatherforecast (
                 area TEXT,
                 forecast TEXT,
                 timestamp TIMESTAMP
             );
 
+            CREATE TABLE IF NOT EXISTS ingestion_state (
+                table_name TEXT PRIMARY KEY,
+                payload_hash TEXT,
+                refreshed_at TIMESTAMP,
+                changed_at TIMESTAMP
+            );
+
             """
 DROP_TABLES_QUERY = """
             DROP TABLE IF EXISTS
@@ -137,5 +161,28 @@ DROP_TABLES_QUERY = """
             roadopenings, roadworks,
             trafficimages, trafficincidents,
             trafficspeedbands, vms,
-            airtemp, rainfall, psi, weatherforecast;
+            airtemp, rainfall, psi, weatherforecast,
+            ingestion_state;
+            """
+
+# Natural keys of the tables which are upserted on refresh. Tables not listed here
+# have no natural key and are replaced wholesale instead when their data changes.
+TABLE_KEYS = {
+    "carpark": ["carparkid", "lottype"],
+    "roadopenings": ["eventid"],
+    "roadworks": ["eventid"],
+    "trafficspeedbands": ["linkid"],
+}
+
+# Records that a table was refreshed. refreshed_at is bumped on every refresh while
+# changed_at is only bumped when data was written, so the timestamp column of the
+# tables themselves only tells when a row last changed.
+MARK_REFRESHED_QUERY = """
+            INSERT INTO ingestion_state (table_name, payload_hash, refreshed_at, changed_at)
+            VALUES (%(table_name)s, %(payload_hash)s, NOW(), NOW())
+            ON CONFLICT (table_name) DO UPDATE SET
+                payload_hash = EXCLUDED.payload_hash,
+                refreshed_at = EXCLUDED.refreshed_at,
+                changed_at = CASE WHEN %(changed)s THEN EXCLUDED.changed_at
+                    ELSE ingestion_state.changed_at END;
             """
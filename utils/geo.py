@@ -0,0 +1,116 @@
+import math
+
+import numpy as np
+
+EARTH_RADIUS_M = 6371000
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """
+    Great-circle distance in metres between points given in degrees. Works on both
+    scalars and numpy arrays.
+    """
+    phi1, phi2 = np.radians(lat1), np.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = np.radians(np.subtract(lon2, lon1))
+    a = np.sin(dphi / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
+
+
+def geohash_encode(lat, lon, precision):
+    """
+    Encodes a point into a geohash, a string in which every character narrows the cell down
+    further, so points close together share a prefix. At precision 6 a cell is about
+    1.2km by 0.6km, and at precision 5 about 4.9km by 4.9km.
+    """
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars = []
+    bits, bit_count, even = 0, 0, True
+    while len(chars) < precision:
+        # bits alternate between longitude and latitude, starting with longitude
+        value, value_range = (lon, lon_range) if even else (lat, lat_range)
+        mid = (value_range[0] + value_range[1]) / 2
+        if value >= mid:
+            bits = bits * 2 + 1
+            value_range[0] = mid
+        else:
+            bits = bits * 2
+            value_range[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_BASE32[bits])
+            bits, bit_count = 0, 0
+    return "".join(chars)
+
+
+def geohash_cell_size(precision):
+    """
+    :returns: tuple of (latitude, longitude) size of a geohash cell in degrees
+    """
+    lon_bits = math.ceil(precision * 5 / 2)
+    lat_bits = math.floor(precision * 5 / 2)
+    return 180 / 2**lat_bits, 360 / 2**lon_bits
+
+
+def geohash_neighbourhood(lat, lon, precision):
+    """
+    Geohashes of the cell containing a point and its 8 surrounding cells. Every point within
+    one cell size of the given point lies in one of these cells.
+    """
+    dlat, dlon = geohash_cell_size(precision)
+    return sorted(
+        {
+            geohash_encode(lat + i * dlat, lon + j * dlon, precision)
+            for i in (-1, 0, 1)
+            for j in (-1, 0, 1)
+        }
+    )
+
+
+def decode_polyline(encoded):
+    """
+    Decodes a polyline in Google's encoded polyline format, as in the polylines of
+    Directions API routes and steps.
+
+    :returns: tuple of (latitudes, longitudes) numpy arrays of the points
+    """
+    coords = []
+    index, lat, lon = 0, 0, 0
+    while index < len(encoded):
+        for is_lon in (False, True):
+            shift, result = 0, 0
+            while True:
+                byte = ord(encoded[index]) - 63
+                index += 1
+                result |= (byte & 0x1F) << shift
+                shift += 5
+                if byte < 0x20:
+                    break
+            delta = ~(result >> 1) if result & 1 else result >> 1
+            if is_lon:
+                lon += delta
+            else:
+                lat += delta
+        coords.append((lat, lon))
+    points = np.array(coords, dtype=np.float64).reshape(-1, 2) / 1e5
+    return points[:, 0], points[:, 1]
+
+
+def encode_polyline(lats, lons):
+    """
+    Encodes points in Google's encoded polyline format, the reverse of decode_polyline.
+    """
+    chars = []
+    previous_lat, previous_lon = 0, 0
+    for lat, lon in zip(lats, lons):
+        lat, lon = round(lat * 1e5), round(lon * 1e5)
+        for delta in (lat - previous_lat, lon - previous_lon):
+            value = ~(delta << 1) if delta < 0 else delta << 1
+            while value >= 0x20:
+                chars.append(chr((0x20 | (value & 0x1F)) + 63))
+                value >>= 5
+            chars.append(chr(value + 63))
+        previous_lat, previous_lon = lat, lon
+    return "".join(chars)
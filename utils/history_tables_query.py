@@ -0,0 +1,35 @@
+# Tables whose changes are also appended to a <table>_history table. History tables are
+# range-partitioned by timestamp into daily partitions, which are created on demand as data
+# comes in and dropped whole once they are older than HISTORY_RETENTION_DAYS.
+HISTORY_TABLES = ["carpark", "trafficincidents", "trafficspeedbands"]
+HISTORY_RETENTION_DAYS = 30
+
+# History tables are not dropped with the live tables, so a reset keeps the history.
+# Queries with a timestamp range, e.g. (NOW() - INTERVAL '1 hour') <= timestamp, only
+# scan the partitions that overlap the range.
+CREATE_HISTORY_TABLES_QUERY = "\n".join(
+    f"""
+            CREATE TABLE IF NOT EXISTS {table_name}_history (LIKE {table_name})
+            PARTITION BY RANGE (timestamp);
+            CREATE INDEX IF NOT EXISTS {table_name}_history_timestamp_idx
+            ON {table_name}_history (timestamp);
+            """
+    for table_name in HISTORY_TABLES
+)
+
+CREATE_PARTITION_QUERY = """
+            CREATE TABLE IF NOT EXISTS {partition_name}
+            PARTITION OF {table_name}_history
+            FOR VALUES FROM ('{start:%Y-%m-%d}') TO ('{end:%Y-%m-%d}');
+            """
+
+LIST_PARTITIONS_QUERY = """
+            SELECT child.relname FROM pg_inherits
+            JOIN pg_class parent ON pg_inherits.inhparent = parent.oid
+            JOIN pg_class child ON pg_inherits.inhrelid = child.oid
+            WHERE parent.relname = %s;
+            """
+
+
+def partition_name(table_name, day):
+    return f"{table_name}_history_p{day:%Y%m%d}"
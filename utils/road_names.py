@@ -0,0 +1,102 @@
+import re
+
+# expressways are known by their abbreviations in LTA data, but by their full names in Google Maps.
+# Names are looked up with hyphens folded into spaces and Google's EXPY and PKWY spelt out.
+EXPRESSWAYS = {
+    "AYER RAJAH EXPRESSWAY": "AYE",
+    "BUKIT TIMAH EXPRESSWAY": "BKE",
+    "CENTRAL EXPRESSWAY": "CTE",
+    "EAST COAST PARKWAY": "ECP",
+    "KALLANG PAYA LEBAR EXPRESSWAY": "KPE",
+    "KRANJI EXPRESSWAY": "KJE",
+    "MARINA COASTAL EXPRESSWAY": "MCE",
+    "NORTH SOUTH CORRIDOR": "NSC",
+    "PAN ISLAND EXPRESSWAY": "PIE",
+    "SELETAR EXPRESSWAY": "SLE",
+    "TAMPINES EXPRESSWAY": "TPE",
+    "WOODLANDS CHECKPOINT": "WOODLANDS CHECKPOINT",
+}
+# abbreviations Google Maps uses in expressway names, e.g. "Ayer Rajah Expy"
+EXPRESSWAY_WORDS = {"EXPY": "EXPRESSWAY", "PKWY": "PARKWAY"}
+# road types are spelt out or abbreviated depending on the source, so always abbreviate them
+ROAD_TYPES = {
+    "AVENUE": "AVE",
+    "BOULEVARD": "BLVD",
+    "CENTRAL": "CTRL",
+    "CLOSE": "CL",
+    "CRESCENT": "CRES",
+    "DRIVE": "DR",
+    "HEIGHTS": "HTS",
+    "LANE": "LN",
+    "NORTH": "NTH",
+    "PARK": "PK",
+    "PLACE": "PL",
+    "ROAD": "RD",
+    "SOUTH": "STH",
+    "STREET": "ST",
+    "TERRACE": "TER",
+    "WAY": "WY",
+}
+
+_TIME_PREFIX = re.compile(r"^\(\d{1,2}/\d{1,2}\)\d{1,2}:\d{2}\s*")
+_ENDS = (
+    r"(?=\s+\(|\s+at\s|\s+after\s|\s+before\s|\s+between\s|\s+near\s|\s+from\s|\s+to\s"
+    r"|\.|,|$)"
+)
+_ROAD_PATTERNS = [
+    re.compile(r"\b(?:on|in)\s+(.+?)" + _ENDS),
+    re.compile(r"\b(?:at|after|before|near)\s+(.+?)" + _ENDS),
+    re.compile(r"\bbetween\s+(.+?)\s+and\s+(.+?)" + _ENDS),
+    re.compile(r"\bfrom\s+(.+?)\s+to\s+(.+?)" + _ENDS),
+]
+_EXIT_SUFFIX = re.compile(r"\s+(?:EXIT|ENTRANCE|SLIP RD|JUNCTION|TUNNEL)$")
+
+
+def normalize_road_name(name):
+    """
+    Brings road names from different sources into one form, e.g. "Pan Island Expressway (PIE)",
+    Google's "Pan-Island Expy" and "PIE" all become "PIE", "Ayer Rajah Expy" becomes "AYE",
+    "East Coast Pkwy" becomes "ECP" and "Boon Lay Drive" becomes "BOON LAY DR".
+    """
+    name = re.sub(r"\s+", " ", name.upper()).strip(" .,")
+    abbreviation = re.search(r"\(([A-Z]{2,4})\)$", name)
+    if abbreviation and abbreviation.group(1) in EXPRESSWAYS.values():
+        return abbreviation.group(1)
+    name = re.sub(r"\s*\(.*?\)", "", name)
+    expressway = " ".join(
+        EXPRESSWAY_WORDS.get(word, word) for word in re.sub(r"\s*[-–]\s*", " ", name).split(" ")
+    )
+    if expressway in EXPRESSWAYS:
+        return EXPRESSWAYS[expressway]
+    return " ".join(ROAD_TYPES.get(word, word) for word in name.split(" "))
+
+
+def extract_incident_roads(message):
+    """
+    Extracts the names of the roads an incident message refers to, e.g.
+    "(17/10)14:32 Accident on PIE (towards Tuas) after Eunos Rd Exit." gives ["PIE", "EUNOS RD"],
+    "Heavy Traffic on CTE (towards AYE) from Braddell Rd to Moulmein Rd." gives
+    ["CTE", "BRADDELL RD", "MOULMEIN RD"] and "Accident at Jurong West Ave 1/Jurong West St 41
+    junction." gives ["JURONG WEST AVE 1", "JURONG WEST ST 41"]. The road the message says
+    traffic is heading towards is not included.
+
+    :param message: incident message from the TrafficIncidents API
+    :returns: list of normalized road names, in order of appearance and without duplicates
+    """
+    message = _TIME_PREFIX.sub("", message or "")
+    # the direction of traffic is not where the incident is
+    message = re.sub(r"\(towards [^)]*\)", "", message)
+    matches = []
+    for pattern in _ROAD_PATTERNS:
+        for match in pattern.finditer(message):
+            for position, group in enumerate(match.groups()):
+                matches.append((match.start(), position, group))
+
+    roads = []
+    for _, _, match in sorted(matches):
+        # junctions are given as the roads which meet there, e.g. "Ave 1/St 41 junction"
+        for road in match.split("/"):
+            road = _EXIT_SUFFIX.sub("", normalize_road_name(road))
+            if road and road not in roads:
+                roads.append(road)
+    return roads